@@ -1,31 +1,104 @@
 """
 This module implements the PI controller for the AQM algorithm.
 """
+import itertools
+import logging
+import math
+from functools import lru_cache
+
 from omnetpypy import sim_log
 
 
+@lru_cache(maxsize=256)
+def _pi_params(R_plus, C, N_minus, q_ref):
+    """
+    Compute the (alpha, beta, T) parameters of the PI controller, see :meth:`PIController.set_parameters`.
+    The result only depends on the inputs, so it is cached across controllers sharing the same link profile.
+    """
+    omega_g = 2*N_minus/(R_plus*R_plus*C)
+    assert omega_g < 0.05/R_plus, "The PI controller could not be stable"
+    p_queue = 1/R_plus
+
+    T = 1/(omega_g*100)
+
+    # module of (j*omega_g/p_queue + 1), computed in real arithmetic
+    mag = math.hypot(1.0, omega_g/p_queue)
+    rc3 = (R_plus*C)**3
+    inv_den = (2*N_minus)**2
+    K_PI = mag/(rc3/inv_den)*omega_g*100  # TODO: remove the *10
+
+    assert 1-omega_g*T > 0, "The PI controller could not be stable"
+    alpha = K_PI/omega_g
+    beta = alpha*(1-omega_g*T)
+
+    if sim_log.logger.isEnabledFor(logging.DEBUG):
+        # sim_log formats eagerly, so skip building the message when it would be dropped
+        sim_log.debug(f"PI controller parameters: alpha={alpha}, beta={beta}, q_ref={q_ref}, K_PI={K_PI},"
+                      f"omega_g={omega_g}, T={T}")
+
+    return alpha, beta, T
+
+
+_PI_TABLE = {}
+# precomputed (alpha, beta, T) for parameter sweeps, indexed by (R_plus, C, N_minus, q_ref). See build_pi_table
+
+
+def build_pi_table(R_pluses, Cs, N_minuses, q_refs):
+    """
+    Precompute the PI controller parameters over the Cartesian product of the given inputs, so that controllers set
+    up during a parameter sweep just look them up. Each entry is computed by the same code as an uncached
+    :meth:`PIController.set_parameters` call, hence the table never changes the parameters a controller gets.
+
+    Parameters
+    ----------
+    R_pluses : list of float
+        The maximum RTTs in seconds for which the PI controller is stable
+    Cs : list of float
+        The channel capacities in LLE attempts per second
+    N_minuses : list of float
+        The minimum numbers of TCP-like flows passing through the link
+    q_refs : list of float
+        The reference queue sizes in (avg) LLE attempts
+
+    Returns
+    -------
+    dict
+        The (alpha, beta, T) tuples indexed by (R_plus, C, N_minus, q_ref). The same entries are used by
+        :meth:`PIController.set_parameters`. The combinations for which the PI controller could not be stable are
+        left out, set_parameters still rejects them.
+    """
+    table = {}
+    for key in itertools.product(R_pluses, Cs, N_minuses, q_refs):
+        try:
+            # bypass the lru cache, a sweep would only evict the entries of the running simulation
+            table[key] = _pi_params.__wrapped__(*key)
+        except AssertionError:
+            continue
+
+    _PI_TABLE.update(table)
+    return table
+
+
 class PIController:
 
+    __slots__ = ("alpha", "beta", "q_ref", "update", "_state")
+
     def __init__(self):
         self.alpha = None
         self.beta = None
         self.q_ref = None
 
-        self.q_old = 0
-        self.p_old = 0
+        self._state = [0, 0]
+        # [e_old, p_old]: error (q_old - q_ref) and marking probability at the previous sample
 
-        self.q = 0
-        self.p = 0
+        self.update = self._update_without_parameters
+        """update(q) callable, replaced by a specialized closure once the parameters are set"""
 
-    def update(self, q):
-        self.q = q
-        self.p = self.alpha * (self.q - self.q_ref) - self.beta * (self.q_old - self.q_ref) + self.p_old
-        # print(f"q_ref={self.q_ref}, q={self.q}, p={self.p}, p_old={self.p_old}, q_old={self.q_old}")
-        self.q_old = self.q
-        self.p_old = self.p
+    def _update_without_parameters(self, q):
+        raise ValueError("The PI controller parameters must be set with set_parameters before calling update")
 
     def get_marking_probability(self):
-        return self.p
+        return self._state[1]
         # return 0.
 
     def set_parameters(self, R_plus, C, N_minus, q_ref):
@@ -49,22 +122,23 @@ class PIController:
             The time interval in seconds for the PI controller sampling
         """
 
-        omega_g = 2*N_minus/(R_plus*R_plus*C)
-        assert omega_g < 0.05/R_plus, "The PI controller could not be stable"
-        p_queue = 1/R_plus
-
-        T = 1/(omega_g*100)
-
-        K_PI = (complex(0, omega_g)/p_queue + 1)/((R_plus*C)**3/(2*N_minus)**2)
-        # turn K_PI into a real number by taking the module
-        K_PI = abs(K_PI)*omega_g*100  # TODO: remove the *10
+        params = _PI_TABLE.get((R_plus, C, N_minus, q_ref))
+        if params is None:
+            params = _pi_params(R_plus, C, N_minus, q_ref)
+        self.alpha, self.beta, T = params
 
-        assert 1-omega_g*T > 0, "The PI controller could not be stable"
-        self.alpha = K_PI/omega_g
-        self.beta = self.alpha*(1-omega_g*T)
+        # express the previous error against the new reference queue size
+        state = self._state
+        state[0] += (self.q_ref if self.q_ref is not None else 0) - q_ref
         self.q_ref = q_ref
 
-        sim_log.debug(f"PI controller parameters: alpha={self.alpha}, beta={self.beta}, q_ref={q_ref}, K_PI={K_PI},"
-                      f"omega_g={omega_g}, T={T}")
+        # alpha, beta and q_ref are now fixed: bind them as locals of a specialized update
+        def update(q, _s=state, _a=self.alpha, _b=self.beta, _qr=q_ref):
+            e = q - _qr
+            _s[1] = _a * e - _b * _s[0] + _s[1]
+            _s[0] = e
+
+        self.update = update
 
         return T
+
@@ -1,102 +1,183 @@
+from concurrent.futures import ThreadPoolExecutor
+
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
+from matplotlib.collections import LineCollection, PolyCollection
+
+from qnum_congestion_ctrl_aqm_bidir.plot_utils import init_backend
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+except ImportError:  # pyarrow is optional, load_tail falls back to pandas
+    pa = None
+    pacsv = None
+
+
+READ_KW = dict(engine="pyarrow", usecols=["timestamp", "sample"])
+# multithreaded pyarrow parser, only the two columns we need
+READ_KW_FALLBACK = dict(engine="c", usecols=["timestamp", "sample"], memory_map=True,
+                        dtype={"timestamp": "float64", "sample": "float64"})
+# pandas C parser, used when pyarrow is not installed
+
+
+def read_vector(path):
+    """
+    Read the timestamp and sample columns of a vector CSV
+    """
+    try:
+        return pd.read_csv(path, **READ_KW)
+    except ImportError:
+        return pd.read_csv(path, **READ_KW_FALLBACK)
+
+
+STREAM_BLOCK_SIZE = 64 << 20  # bytes parsed per pyarrow batch
+
+
+def stream_tail(path):
+    """
+    Stream a vector CSV in batches with pyarrow and return the (timestamps, samples) of the last half of the
+    simulation. A batch is dropped as soon as all its timestamps are below half of the largest timestamp seen so
+    far, since the final cutoff can only grow. With monotonic timestamps (as written by the simulator) the peak
+    memory is the tail half plus one batch.
+    """
+    reader = pacsv.open_csv(
+        path,
+        read_options=pacsv.ReadOptions(block_size=STREAM_BLOCK_SIZE),
+        convert_options=pacsv.ConvertOptions(include_columns=["timestamp", "sample"],
+                                             column_types={"timestamp": pa.float64(), "sample": pa.float64()}))
+    kept = []  # (batch max timestamp, timestamps, samples)
+    ts_max = -np.inf
+    for batch in reader:
+        if batch.num_rows == 0:
+            continue
+        # zero copy unless the column has nulls (e.g. empty fields), which are read as NaN like pandas does
+        ts = batch.column("timestamp").to_numpy(zero_copy_only=False)
+        samples = batch.column("sample").to_numpy(zero_copy_only=False)
+        b_max = ts.max()
+        ts_max = max(ts_max, b_max)
+        kept.append((b_max, ts, samples))
+        cutoff = ts_max * 0.5
+        if kept[0][0] < cutoff:
+            kept = [k for k in kept if k[0] >= cutoff]
+    if not kept:
+        return np.empty(0), np.empty(0)
+    ts = np.concatenate([k[1] for k in kept])
+    samples = np.concatenate([k[2] for k in kept])
+    mask = ts >= ts_max * 0.5
+    return ts[mask], samples[mask]
+
+
+def load_tail(path, scale=1.0):
+    """
+    Load the samples of a vector CSV that belong to the last half of the simulation, multiplied by scale
+    """
+    if pacsv is not None:
+        return stream_tail(path)[1] * scale
+    arr = read_vector(path).to_numpy(dtype=np.float64)
+    ts = arr[:, 0]
+    samples = arr[:, 1]
+    # only keep the last half of the simulation
+    mask = ts >= ts.max() * 0.5
+    return samples[mask] * scale
+
+
+PERCENTILES = np.array([0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99])
+
+
+def summarize(arr):
+    """
+    Compute the boxplot statistics of arr with a single sort: the 1st, 5th, 25th, 50th, 75th, 95th, 99th percentiles
+    (linear interpolation, as numpy.quantile), the mean, the min and the max. An empty arr (e.g. no completed
+    requests in the second half of the run) gives NaNs, as pandas' describe does
+    """
+    s = np.sort(arr)
+    n = len(s)
+    if n == 0:
+        return np.full(len(PERCENTILES), np.nan), np.nan, np.nan, np.nan
+    idx = PERCENTILES * (n - 1)
+    lo = np.floor(idx).astype(int)
+    hi = np.ceil(idx).astype(int)
+    frac = idx - lo
+    q = s[lo] * (1 - frac) + s[hi] * frac
+    return q, arr.mean(), s[0], s[-1]
 
-def custom_boxplot(ax, data, mean, title, ylim, min_max=None, legend=False, x_labels=None):
-    boxprops = dict(linestyle='-', linewidth=1., edgecolor='blue', facecolor='lightblue')
-    whiskerprops = dict(color='black', linewidth=1.)
-    capprops = dict(color='black', linewidth=1.)
-
-    # make the median props as a solid black line
-    medianprops = dict(color='black', linewidth=1.)
-
-    # make the mean props as a dashed green line
-    meanprops = dict(color='darkgreen', linestyle='--', linewidth=1.)
 
+def custom_boxplot(ax, data, mean, title, ylim, min_max=None, legend=False, x_labels=None):
     if not isinstance(data, list):
         data = [data]
         mean = [mean]
 
-    boxes = []
+    # index the 7-element percentile vectors positionally, also when they are pandas Series
+    data = [np.asarray(d) for d in data]
+
+    width = 0.5  # box width
+    cap_width = width / 2
+
     outliers = []
+    boxes = []
+    segments = []
 
     for i in range(len(data)):
+        x = i + 1
+        arr = data[i]
+
         # extract outliers from the data (1 and 99 percentiles), i.e, first and last rows if min_max is None
-        outliers.append(data[i].iloc[[0, -1]])
+        outliers.append((arr[0], arr[-1]))
 
         # extract the box data (25th, 50th, 75th percentiles)
-        box_data = data[i].iloc[2:5]
+        q1, med, q3 = arr[2:5]
 
         # extract the whisker data (5th, 95th percentiles)
-        whisker_data = data[i].iloc[[1, 6]]
-
-        my_dict = {
-            'med': box_data[1],
-            'q1': box_data[0],
-            'q3': box_data[2],
-            'whislo': whisker_data[0],
-            'whishi': whisker_data[1],
-            'fliers': [],
-            'mean': mean
-        }
-
-        boxes.append(my_dict)
-
-    # Create boxplot manually
-    ax.bxp(boxes, showmeans=False, meanline=True, widths=0.5,
-        boxprops=boxprops, whiskerprops=whiskerprops,
-        capprops=capprops, medianprops=medianprops,
-        meanprops=meanprops, patch_artist=True)
-
-    for i in range(len(mean)):
-        label = "mean" if i == 0 else None
-        ax.plot(i+1, mean[i], 'mx', label=label)
+        whislo, whishi = arr[1], arr[6]
+
+        boxes.append([(x - width / 2, q1), (x + width / 2, q1), (x + width / 2, q3), (x - width / 2, q3)])
+
+        segments.extend([
+            [(x, whislo), (x, q1)],  # lower whisker
+            [(x, q3), (x, whishi)],  # upper whisker
+            [(x - cap_width / 2, whislo), (x + cap_width / 2, whislo)],  # lower cap
+            [(x - cap_width / 2, whishi), (x + cap_width / 2, whishi)],  # upper cap
+            [(x - width / 2, med), (x + width / 2, med)],  # median, a solid black line
+        ])
+
+    # Create boxplot manually: one collection for all the boxes and one for all the whiskers, caps and medians
+    ax.add_collection(PolyCollection(np.array(boxes), facecolors='lightblue', edgecolors='blue', linestyles='-',
+                                     linewidths=1., zorder=2))
+    ax.add_collection(LineCollection(np.array(segments), colors='black', linewidths=1., zorder=2))
+    ax.set_xlim(0.5, len(data) + 0.5)
+
+    xs = np.arange(1, len(data) + 1)
+
+    # one artist per marker kind. zorder=2 to draw the markers above the boxes, like ax.plot does
+    ax.scatter(xs, mean, marker='x', color='m', zorder=2, label="mean")
 
     # plot the outliers as white circles with a black border
-    for i, outlier in enumerate(outliers):
-        label = "1st, 99th" if i == 0 else None
-        ax.plot([i+1, i+1], [outlier[0], outlier[1]], 'wo', markeredgecolor='black', label=label)
+    outliers = np.asarray(outliers)
+    ax.scatter(np.concatenate((xs, xs)), np.concatenate((outliers[:, 0], outliers[:, 1])), marker='o',
+               facecolors='white', edgecolors='black', linewidths=1., zorder=2, label="1st, 99th")
 
     if min_max is not None:
 
         if not isinstance(min_max, list):
             min_max = [min_max]
 
+        # we plot the min and max values as well, min as a green triangle pointing down, max as a red triangle pointing up
+        min_max_arr = np.asarray(min_max)
+        ax.scatter(xs, min_max_arr[:, 0], marker='v', color='g', zorder=2, label="min")
+        ax.scatter(xs, min_max_arr[:, 1], marker='^', color='r', zorder=2, label="max")
+
+        # values outside the y limits are not visible: point at them with an arrow labelled with the value
+        y_span = ylim[1] - ylim[0]
         for i, min_max_val in enumerate(min_max):
-            label_min = "min" if i == 0 else None
-            label_max = "max" if i == 0 else None
-            # we plot the min and max values as well, min as a green triangle pointing down, max as a red triangle pointing up
-            ax.plot(i+1, min_max_val[0], 'gv', label=label_min)
-            ax.plot(i+1, min_max_val[1], 'r^', label=label_max)
-
-            # check whether the min and max values are within the y limits
-            # if not, we create a window within this plot to show them
             if min_max_val[0] < ylim[0]:
-                # generate a rectangle to show the min value. put it right below the 1st percentile dot
-                x_pos = 0.5*(2*i + 1)/len(data) - 0.05
-                ax2 = ax.inset_axes([x_pos, 0.05, 0.1, 0.1])
-                ax2.set_xticks([])
-                # set the y-ticks to the min value and format it so that it has at most 2 decimal places
-                min_2dp = float("{:.2f}".format(min_max_val[0]))
-                ax2.set_yticks([min_2dp])
-
-                ax2.plot(1, min_max_val[0], 'gv')
-                ax2.set_xlim(0.5, 1.5)
-                ax2.set_ylim(min_max_val[0] - min_max_val[0] * 0.1, min_max_val[0] + min_max_val[0] * 0.1)
-
+                ax.annotate(f"{min_max_val[0]:.2f}", xy=(i + 1, ylim[0]), xytext=(i + 1.35, ylim[0] + 0.05 * y_span),
+                            arrowprops=dict(arrowstyle='->', color='green'), ha='center', va='center', fontsize=8)
 
             if min_max_val[1] > ylim[1]:
-                # generate a rectangle to show the max value. put it right above the main plot
-                x_pos = 0.5 * (2 * i + 1) / len(data) - 0.05
-                ax3 = ax.inset_axes([x_pos, 0.85, 0.1, 0.1])
-                ax3.set_xticks([])
-                ax3.set_yticks([min_max_val[1]])
-                ax3.plot(1, min_max_val[1], 'r^')
-                ax3.set_xlim(0.5, 1.5)
-                ax3.set_ylim(min_max_val[1] - min_max_val[1] * 0.1, min_max_val[1] + min_max_val[1] * 0.1)
-
-
-
+                ax.annotate(f"{min_max_val[1]:.2f}", xy=(i + 1, ylim[1]), xytext=(i + 1.35, ylim[1] - 0.05 * y_span),
+                            arrowprops=dict(arrowstyle='->', color='red'), ha='center', va='center', fontsize=8)
 
     ax.set_title(title, fontsize=18, fontweight='bold', fontname='Arial')
     ax.set_ylim(ylim)
@@ -117,43 +198,57 @@ def custom_boxplot(ax, data, mean, title, ylim, min_max=None, legend=False, x_la
 
 
 
-if __name__ == "__main__":
-    # Sample data
-    data = {
-        'Fidelity': [0.99, 0.98, 0.97, 0.96, 0.95],
-        'Latency': [100, 150, 200, 250, 300] # milliseconds
-    }
-
-    """'Queue Size (non congested)': [0.1, 0.15, 0.2, 0.25, 0.3],  # num of requests
-    'Queue Size (bottleneck link)': [10, 15, 20, 25, 30]  # num of requests"""
-
-    csvs_lat = ["./out/latency_vector.csv", "./out2/latency_vector.csv"]
-    csvs_fid = ["./out/fidelity_vector.csv", "./out2/fidelity_vector.csv"]
-    x_labels = ["no RV", "with RV"]
-
-    # replace the sample data with the data from the csv files
-    df_list = []
+def main_plot(csvs_lat, csvs_fid, x_labels, out_path="./out/boxplots.pdf", fig=None):
+    """
+    Plot the fidelity and latency boxplots for the given simulation outputs and save them to out_path.
+
+    Parameters
+    ----------
+    csvs_lat : list of str
+        The latency vector CSV files, one for each box
+    csvs_fid : list of str
+        The fidelity vector CSV files, one for each box
+    x_labels : list of str
+        The labels of the boxes
+    out_path : str, optional
+        Where to save the figure. Default is "./out/boxplots.pdf".
+    fig : :class:`matplotlib.figure.Figure` or None, optional
+        A figure to clear and reuse, e.g. across the runs of a parameter sweep. If None, a new figure is created.
+
+    Returns
+    -------
+    :class:`matplotlib.figure.Figure`
+        The figure with the boxplots
+    """
+
+    # read the boxplot data from the csv files
+    fid_quantiles_list = []
     mean_fid_list = []
     min_max_fid_list = []
+    lat_quantiles_list = []
     mean_lat_list = []
     min_max_lat_list = []
 
 
+    # the files are independent, read them concurrently (the parsers release the GIL)
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        lat_futures = [executor.submit(load_tail, path, scale=1e-3) for path in csvs_lat]  # ms
+        fid_futures = [executor.submit(load_tail, path) for path in csvs_fid]
+        lat_tails = [future.result() for future in lat_futures]
+        fid_tails = [future.result() for future in fid_futures]
+
     for i in range(len(csvs_lat)):
-        df_latency = pd.read_csv(csvs_lat[i])
-        # only keep the last half of the simulation
-        df_latency = df_latency[df_latency["timestamp"] >= df_latency["timestamp"].max() / 2]
-        df_latency["sample"] /= 1e3  # ms
         # compute boxplot data for latency, i.e., the 1st, 5th, 25th, 50th, 75th, 95th, 99th percentiles and the mean
-        latency_boxplot_data = df_latency["sample"].describe(percentiles=[0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99])
-        data['Latency'] = latency_boxplot_data[['1%', '5%', '25%', '50%', '75%', '95%', '99%']]
+        lat_q, lat_mean, lat_min, lat_max = summarize(lat_tails[i])
+        lat_quantiles_list.append(lat_q)
+        mean_lat_list.append(lat_mean)
+        min_max_lat_list.append((lat_min, lat_max))
 
-        df_fid = pd.read_csv(csvs_fid[i])
-        # only keep the last half of the simulation
-        df_fid = df_fid[df_fid["timestamp"] >= df_fid["timestamp"].max() / 2]
         # compute boxplot data for fidelity, i.e. the 1st, 5th, 25th, 50th, 75th, 95th, 99th percentiles and the mean
-        fidelity_boxplot_data = df_fid["sample"].describe(percentiles=[0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99])
-        data['Fidelity'] = fidelity_boxplot_data[['1%', '5%', '25%', '50%', '75%', '95%', '99%']]
+        fid_q, fid_mean, fid_min, fid_max = summarize(fid_tails[i])
+        fid_quantiles_list.append(fid_q)
+        mean_fid_list.append(fid_mean)
+        min_max_fid_list.append((fid_min, fid_max))
 
         """df_queue_size_unc = pd.read_csv("./out/queue_size_free_vector.csv")
         # compute boxplot data for SKR, i.e. the 5th, 25th, 50th, 75th, 95th percentiles and the mean
@@ -165,18 +260,14 @@ if __name__ == "__main__":
         queue_boxplot_data = df_queue["sample"].describe(percentiles=[0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99])
         data['Queue Size (bottleneck link)'] = queue_boxplot_data[['1%', '5%', '25%', '50%', '75%', '95%', '99%']]"""
 
-
-        df = pd.DataFrame(data)
-        df_list.append(df)
-
-        mean_fid_list.append(df_fid["sample"].mean())
-        min_max_fid_list.append((df_fid["sample"].min(), df_fid["sample"].max()))
-        mean_lat_list.append(df_latency["sample"].mean())
-        min_max_lat_list.append((df_latency["sample"].min(), df_latency["sample"].max()))
-
     # create custom boxplots from the percentiles we already have
 
-    fig, axes = plt.subplots(nrows=1, ncols=2, figsize=(4, 4))
+    if fig is None:
+        fig, axes = plt.subplots(nrows=1, ncols=2, figsize=(4, 4))
+    else:
+        # reuse the figure of a previous run, avoiding the figure and font setup
+        fig.clf()
+        axes = fig.subplots(nrows=1, ncols=2)
 
     # Fidelity
     # create a nice boxplot for the fidelity from scratch, without using the built-in boxplot function
@@ -184,7 +275,7 @@ if __name__ == "__main__":
     # the boxplot consists of the 25th, 50th, and 75th percentiles, the whiskers are the 5th and 95th percentiles
     # and the outliers are the 1st and 99th percentiles
     # we also show the mean as a dashed line
-    custom_boxplot(axes[0], [df["Fidelity"] for df in df_list], mean_fid_list, 'Fidelity', (0.5, 1), min_max_fid_list, True, x_labels)
+    custom_boxplot(axes[0], fid_quantiles_list, mean_fid_list, 'Fidelity', (0.5, 1), min_max_fid_list, True, x_labels)
 
     # add grids so that every y-tick has a grid line
     axes[0].grid(axis='y', linestyle='--', linewidth=0.5)
@@ -195,7 +286,7 @@ if __name__ == "__main__":
     # the boxplot consists of the 25th, 50th, and 75th percentiles, the whiskers are the 5th and 95th percentiles
     # and the outliers are the 1st and 99th percentiles
     # we also show the mean as a dashed line
-    custom_boxplot(axes[1], [df["Latency"] for df in df_list], mean_lat_list, 'Latency (ms)', (0, 60), min_max_lat_list, False, x_labels)
+    custom_boxplot(axes[1], lat_quantiles_list, mean_lat_list, 'Latency (ms)', (0, 60), min_max_lat_list, False, x_labels)
 
     # add grids so that every y-tick has a grid line
     axes[1].grid(axis='y', linestyle='--', linewidth=0.5)
@@ -244,10 +335,21 @@ if __name__ == "__main__":
     axes[1, 1].set_ylim(0, 40)
     # axes[1, 1].legend(loc="upper right")"""
 
-    plt.tight_layout() # Adjust the layout to make room for the main title
+    fig.tight_layout() # Adjust the layout to make room for the main title
 
     # save the plot and make sure it is not cut off
-    plt.savefig("./out/boxplots.pdf", bbox_inches='tight')
+    fig.savefig(out_path, bbox_inches='tight')
+
+    return fig
+
+
+if __name__ == "__main__":
+    interactive = init_backend()
+    csvs_lat = ["./out/latency_vector.csv", "./out2/latency_vector.csv"]
+    csvs_fid = ["./out/fidelity_vector.csv", "./out2/fidelity_vector.csv"]
+    x_labels = ["no RV", "with RV"]
 
-    plt.show()
+    main_plot(csvs_lat, csvs_fid, x_labels)
 
+    if interactive:
+        plt.show()
@@ -1,7 +1,291 @@
 import abc
+import logging
+from math import fabs
 
+import numpy as np
 from omnetpypy import sim_log
 
+try:
+    from numba import njit
+    from numba.core import types
+    from numba.typed import Dict
+except ImportError:  # numba is optional, fall back to plain Python
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+    Dict = None
+
+
+def new_flow_index():
+    """
+    Create an empty flow_id -> dense index map. It is a numba typed dict when numba is available, so that the
+    compiled kernels can resolve flow ids themselves, and a plain dict otherwise.
+    """
+    if Dict is None:
+        return {}
+    return Dict.empty(key_type=types.int64, value_type=types.int64)
+
+
+# the kernels below are compiled eagerly (at import) for the argument types given in their signatures
+# only the fast-math flags that cannot change the rounding of the results are enabled
+FASTMATH = {"nnan", "ninf", "nsz"}
+
+# "no slow start threshold yet": a finite stand-in for infinity, since the kernels assume no Inf/NaN (ninf)
+SSTHRESH_MAX = 1e18
+
+
+@njit("int64(DictType(int64, int64), int64, float64[:], float64[:], float64[:], float64)",
+      cache=True, fastmath=FASTMATH)
+def rtt_sample(index, flow_id, est_rtt, dev_rtt, rto, sample_rtt):
+    """
+    Resolve the dense index of flow_id, update its estimated RTT and RTT deviation (EWMA) with sample_rtt and
+    refresh its request timeout. Returns the dense index.
+    """
+    i = index[flow_id]
+    e = 0.875 * est_rtt[i] + 0.125 * sample_rtt
+    d = 0.75 * dev_rtt[i] + 0.25 * fabs(sample_rtt - e)
+    est_rtt[i] = e
+    dev_rtt[i] = d
+    rto[i] = max(e + 4 * d, 0.1)
+    return i
+
+
+@njit("void(float64[:], float64[:], boolean[:], int64)", cache=True, fastmath=FASTMATH)
+def halve_cwnd(cwnd, ssthresh, slow_start, i):
+    """
+    Congestion event for the flow at index i: the slow start threshold becomes half of the congestion window, and
+    the flow restarts from a window of 1 in slow start
+    """
+    ssthresh[i] = max(cwnd[i] / 2, 1.)
+    cwnd[i] = 1.
+    slow_start[i] = True
+
+
+@njit("void(float64[:], float64[:], boolean[:], int64, float64)", cache=True, fastmath=FASTMATH)
+def update_cwnd(cwnd, ssthresh, slow_start, i, max_cwnd):
+    """
+    Increase the congestion window of the flow at index i without branching on its state: by 1 in slow start
+    (doubling it every RTT), by 1/cwnd otherwise (linear increase). The flow leaves slow start when its window
+    reaches the slow start threshold.
+    """
+    slow = slow_start[i]
+    w = cwnd[i]
+    w = min(max_cwnd, w + (slow + (1 - slow) * (1 / w)))
+    cwnd[i] = w
+    slow_start[i] = slow & (w < ssthresh[i])
+
+
+@njit("int64(float64, int64)", cache=True)
+def requests_to_generate(cwnd, in_flight):
+    """
+    Number of new requests a flow can send: the free room in its congestion window (truncated to an integer), or 0
+    """
+    d = np.int64(cwnd) - in_flight
+    return d if d > 0 else 0
+
+
+@njit("Tuple((int64, boolean))(int64[::1], int64, int64, int64, int64)", cache=True)
+def bisect_ack(req_ids, head, tail, mask, req_id):
+    """
+    Binary search the requests in flight of a ring buffer (slots head..tail-1, wrapped with mask, sorted by req_id)
+    for an ACK of req_id. Returns the number of requests with a lower req_id (they have been surely dropped) and
+    whether req_id itself is in flight.
+    """
+    lo = head
+    hi = tail
+    while lo < hi:
+        mid = (lo + hi) >> 1
+        if req_ids[mid & mask] < req_id:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo - head, lo < tail and req_ids[lo & mask] == req_id
+
+
+@njit("UniTuple(int64, 2)(int64[::1], float64[::1], float64[::1], int64, int64, int64, float64)",
+      cache=True, fastmath=FASTMATH)
+def drop_expired(req_ids, time_sent, timeout, head, tail, mask, current_time):
+    """
+    Remove in place the requests of a ring buffer that have timed out at current_time, keeping the order of the
+    others. The oldest requests usually expire first: the expired prefix is dropped by advancing head, and only the
+    requests after the first live one are compacted (and moved only once a gap has opened). Returns the new head and
+    tail.
+    """
+    while head < tail and current_time - time_sent[head & mask] > timeout[head & mask]:
+        head += 1
+    j = head
+    for i in range(head, tail):
+        s = i & mask
+        if not current_time - time_sent[s] > timeout[s]:
+            if j != i:
+                d = j & mask
+                req_ids[d] = req_ids[s]
+                time_sent[d] = time_sent[s]
+                timeout[d] = timeout[s]
+            j += 1
+    return head, j
+
+
+@njit("UniTuple(int64, 2)(DictType(int64, int64), int64, float64[:], float64[:], float64[:], float64[:], float64[:], "
+      "boolean[:], int32[:], int64[::1], int64, int64, int64, int64, float64, boolean, int64, float64)",
+      cache=True, fastmath=FASTMATH)
+def window_ack(index, flow_id, est_rtt, dev_rtt, rto, cwnd, ssthresh, slow_start, cons_acks,
+               req_ids, head, tail, mask, req_id, sample_rtt, mark_congested, cons_required, max_cwnd):
+    """
+    The whole ACK handling of :meth:`WindowCongestionController.handle_ack` in native code: RTT update, removal
+    of the ACKed and skipped requests from the ring buffer, halving on a congestion event and window increase.
+    Returns the new head of the ring buffer and the number of new requests to generate.
+    """
+    i = rtt_sample(index, flow_id, est_rtt, dev_rtt, rto, sample_rtt)
+
+    num_skipped, found = bisect_ack(req_ids, head, tail, mask, req_id)
+    head += num_skipped + found
+
+    congested = mark_congested or num_skipped > 0
+    if congested:
+        halve_cwnd(cwnd, ssthresh, slow_start, i)
+
+    # a congestion event resets the consecutive acks, then the ACKed request (if found) counts as one more
+    cons = 0 if congested else np.int64(cons_acks[i])
+    cons += found
+    if cons == cons_required:
+        update_cwnd(cwnd, ssthresh, slow_start, i, max_cwnd)
+        cons = 0
+    cons_acks[i] = cons
+
+    return head, requests_to_generate(cwnd[i], tail - head)
+
+
+@njit("int64(DictType(int64, int64), int64, float64[:], float64[:], float64[:], float64[:], float64[:], boolean[:], "
+      "int32[:], int64[::1], int64, int64, int64, int64, float64, int64, float64)", cache=True, fastmath=FASTMATH)
+def window_ack_fastpath(index, flow_id, est_rtt, dev_rtt, rto, cwnd, ssthresh, slow_start, cons_acks,
+                        req_ids, head, tail, mask, req_id, sample_rtt, cons_required, max_cwnd):
+    """
+    :func:`window_ack` specialized for the common case of an in-order ACK that is not marked as congested: the
+    ACKed request is the oldest in flight, so nothing is skipped and there is no congestion event. Returns -1
+    without touching any state if the ACK is not in order, otherwise the number of new requests to generate (the
+    caller then drops the oldest request by advancing head by one).
+    """
+    if head == tail or req_ids[head & mask] != req_id:
+        return -1
+
+    i = rtt_sample(index, flow_id, est_rtt, dev_rtt, rto, sample_rtt)
+    cons = np.int64(cons_acks[i]) + 1
+    if cons == cons_required:
+        update_cwnd(cwnd, ssthresh, slow_start, i, max_cwnd)
+        cons = 0
+    cons_acks[i] = cons
+    return requests_to_generate(cwnd[i], tail - head - 1)
+
+
+class InFlightRequests:
+    """
+    The requests in flight of a flow, stored in a ring buffer of three parallel arrays (req_id, time_sent, timeout).
+    Requests are appended with increasing req_ids, so the buffer is sorted by req_id and ACKs are binary searched.
+    head and tail only grow and the slot of the i-th request is i & mask, so appending a request and dropping the
+    oldest ones are O(1) and never move the data. The capacity is a power of two, doubled when the buffer is full.
+    """
+
+    __slots__ = ("req_ids", "time_sent", "timeout", "mask", "head", "tail", "last_req_id")
+
+    def __init__(self, capacity=64):
+        self.req_ids = np.empty(capacity, dtype=np.int64)
+        self.time_sent = np.empty(capacity)
+        self.timeout = np.empty(capacity)
+        self.mask = capacity - 1
+        self.head = 0
+        self.tail = 0
+        self.last_req_id = -1  # req_id of the newest request, kept as a Python int to check the order on append
+
+    def __len__(self):
+        return self.tail - self.head
+
+    def append(self, req_id, time_sent, timeout):
+        """
+        Add a new request in flight. The request is written straight into the three arrays, no tuple or other
+        object is created for it.
+        """
+        t = self.tail
+        if t > self.head and req_id <= self.last_req_id:
+            raise ValueError(f"Request {req_id} is not newer than the last request in flight")
+        if t - self.head > self.mask:
+            self._grow()
+            t = self.tail
+        s = t & self.mask
+        self.req_ids[s] = req_id
+        self.time_sent[s] = time_sent
+        self.timeout[s] = timeout
+        self.tail = t + 1
+        self.last_req_id = req_id
+
+    def _grow(self):
+        """
+        Double the capacity of the (full) ring buffer, unrolling the requests in flight at the front of the arrays
+        """
+        n = self.tail - self.head
+        order = np.arange(self.head, self.tail) & self.mask
+        for name in self.__slots__[:3]:
+            old = getattr(self, name)
+            new = np.empty(2 * len(old), dtype=old.dtype)
+            new[:n] = old[order]
+            setattr(self, name, new)
+        self.mask = 2 * self.mask + 1
+        self.head = 0
+        self.tail = n
+
+    def bisect_ack(self, req_id):
+        """
+        See :func:`bisect_ack`
+        """
+        return bisect_ack(self.req_ids, self.head, self.tail, self.mask, req_id)
+
+    def pop_front(self, k):
+        """
+        Drop the k oldest requests in flight
+        """
+        self.head += k
+
+    def ordered(self, arr):
+        """
+        Return the requests in flight of arr (one of the three parallel arrays) in order, as a view when they do not
+        wrap around the end of the buffer
+        """
+        h = self.head & self.mask
+        t = h + self.tail - self.head
+        if t <= len(arr):
+            return arr[h:t]
+        return np.concatenate((arr[h:], arr[:t - len(arr)]))
+
+    def drop_timed_out(self, current_time):
+        """
+        Drop the requests in flight that have timed out at current_time, and return how many they were
+        """
+        n = self.tail - self.head
+        self.head, self.tail = drop_expired(self.req_ids, self.time_sent, self.timeout, self.head, self.tail, self.mask,
+                                            current_time)
+        return n - (self.tail - self.head)
+
+
+def count_timed_out(queues, current_time):
+    """
+    Count the requests that have timed out at current_time in each of the InFlightRequests of queues. The requests
+    in flight of all the flows are packed in one flat array and checked with a single vectorized comparison.
+
+    Returns
+    -------
+    numpy.ndarray
+        The number of timed out requests of each queue
+    """
+    if not queues:
+        return np.zeros(0, dtype=np.intp)
+    ends = np.cumsum([len(q) for q in queues])
+    time_sent = np.concatenate([q.ordered(q.time_sent) for q in queues])
+    timeout = np.concatenate([q.ordered(q.timeout) for q in queues])
+    expired = np.zeros(len(time_sent) + 1, dtype=np.intp)
+    np.cumsum(current_time - time_sent > timeout, out=expired[1:])
+    return expired[ends] - expired[np.concatenate(([0], ends[:-1]))]
+
 
 class AIMDCongestionController(abc.ABC):
     """
@@ -83,101 +367,112 @@ class WindowCongestionController(AIMDCongestionController):
     """
     A simple congestion controller that uses the Additive Increase Multiplicative Decrease (AIMD) algorithm
     with a window-based approach.
+
+    The per-flow state is stored in a NumPy structured array with one 48 bytes record per flow (see FLOW_STATE),
+    indexed by a dense flow index that is assigned in :meth:`setup_congestion_control` and translated from the
+    flow_id through ``_idx``. Updating a flow touches a single cache line. The fields are also exposed as array
+    views (cwnd, ssthresh, ...) that write through to the records.
     """
+
+    INITIAL_CAPACITY = 16  # initial number of flow slots, doubled when exhausted
+    FLOW_STATE = np.dtype([
+        ("cwnd", np.float64),  # congestion window
+        ("ssthresh", np.float64),  # slow start threshold
+        ("est_rtt", np.float64),  # estimated RTT
+        ("dev_rtt", np.float64),  # RTT deviation
+        ("rto", np.float64),  # timeout of the new requests, est_rtt + 4 * dev_rtt, refreshed with the estimates
+        ("cons_acks", np.int32),  # consecutive acks
+        ("slow_start", np.bool_),  # flag indicating if the flow is in slow start
+        ("_pad", "V3"),
+    ])
+
     def __init__(self):
 
-        self.congestion_windows = {}  # dictionary of congestion windows, one for each flow, indexed by flow_id
-        self.ssthresh = {}  # dictionary of slow start thresholds, one for each flow, indexed by flow_id
-        self.is_slow_start = {}  # dictionary of flags indicating if the flow is in slow start, indexed by flow_id
-        self.estimated_rtt = {}
-        self.dev_rtt = {}
-        self.requests_in_flight = {}  # dictionary of requests in flight, one list for each flow, indexed by flow_id
-        # every element in the list is a tuple (req_id, time_sent, timeout)
+        self._idx = new_flow_index()  # dense index of each flow in the state arrays, indexed by flow_id
+        self._free = []  # indices released by deleted flows, reused by the next flows
+        self._capacity = 0
+
+        self.state = np.zeros(0, dtype=self.FLOW_STATE)  # one record for each flow
+        self._grow(self.INITIAL_CAPACITY)
+
+        self.requests_in_flight = {}  # dictionary of requests in flight, one InFlightRequests for each flow,
+        # indexed by flow_id
         self.max_congestion_window = 1000  # maximum congestion window size
-        self.consecutive_acks = {}  # dictionary of consecutive acks, one for each flow, indexed by flow_id
         self.consecutive_acks_required = 1  # number of consecutive acks to receive before increasing the congestion window
 
         self.other_ends = {}  # dictionary of other end identifiers, one for each flow, indexed by flow_id
 
         super().__init__()
 
+    def _grow(self, capacity):
+        """
+        Resize the state array to hold capacity flows
+        """
+        self.state = np.resize(self.state, capacity)
+        # per-field views of the records
+        self.cwnd = self.state["cwnd"]
+        self.ssthresh = self.state["ssthresh"]
+        self.est_rtt = self.state["est_rtt"]
+        self.dev_rtt = self.state["dev_rtt"]
+        self.rto = self.state["rto"]
+        self.cons_acks = self.state["cons_acks"]
+        self.slow_start = self.state["slow_start"]
+        self._free.extend(range(capacity - 1, self._capacity - 1, -1))
+        self._capacity = capacity
+
     def halve_congestion_knob(self, flow_id, current_time=None):
         """
         Halve the congestion window for the given flow
         """
-
-        self.ssthresh[flow_id] = max(self.congestion_windows[flow_id] / 2, 1)
-        self.congestion_windows[flow_id] = 1.
-        self.is_slow_start[flow_id] = True
+        halve_cwnd(self.cwnd, self.ssthresh, self.slow_start, self._idx[flow_id])
 
     def increase_congestion_knob(self, flow_id, current_time=None):
         """
         Increase the congestion window for the given flow
         """
-        # sim_log.info(f"Flow {flow_id} congestion window increased to {self.congestion_windows[flow_id]}")
-        if self.is_slow_start[flow_id]:
-            # if the flow is in slow start, double the congestion window
-            self.congestion_windows[flow_id] = min(self.max_congestion_window, self.congestion_windows[flow_id] + 1)
-            if self.congestion_windows[flow_id] >= self.ssthresh[flow_id]:
-                # if the congestion window is greater than the slow start threshold, we are not in slow start anymore
-                self.is_slow_start[flow_id] = False
-            # sim_log.error(f"Flow {flow_id} congestion window increased to {self.congestion_windows[flow_id]}")
-        else:
-            # if the flow is not in slow start, increase the congestion window linearly
-            increment = 1/self.congestion_windows[flow_id]
-            old_congestion_window = self.congestion_windows[flow_id]
-            self.congestion_windows[flow_id] = min(self.max_congestion_window, self.congestion_windows[flow_id] + increment)
-            # sim_log.info(f"Flow {flow_id} congestion window increased from {old_congestion_window} to {self.congestion_windows[flow_id]}")
+        update_cwnd(self.cwnd, self.ssthresh, self.slow_start, self._idx[flow_id], self.max_congestion_window)
 
     def setup_congestion_control(self, flow, current_time=None):
         """
         Setup the congestion control variables for the given flow
         """
-        self.congestion_windows[flow["flow_id"]] = 1.  # initial congestion window size
-        self.estimated_rtt[flow["flow_id"]] = 300 * (len(flow["path"]) - 1) * 10  # 3000 us per hop is the initial value
-        self.dev_rtt[flow["flow_id"]] = 0.05 * self.estimated_rtt[flow["flow_id"]]  # 5% of the estimated RTT
-        self.requests_in_flight[flow["flow_id"]] = []
-        self.other_ends[flow["flow_id"]] = flow["destination"]
-        self.consecutive_acks[flow["flow_id"]] = 0  # number of consecutive acks to receive before increasing the congestion window
-        self.ssthresh[flow["flow_id"]] = float("inf")  # slow start threshold
-        self.is_slow_start[flow["flow_id"]] = True  # flag indicating if the flow is in slow start
+        flow_id = flow["flow_id"]
+        if not self._free:
+            self._grow(2 * self._capacity)
+        i = self._free.pop()
+        self._idx[flow_id] = i
+
+        est_rtt = 3000 * (len(flow["path"]) - 1)  # 3000 us per hop is the initial value
+        dev_rtt = 0.05 * est_rtt  # 5% of the estimated RTT
+        # initial window 1, no slow start threshold yet, no consecutive acks, in slow start
+        self.state[i] = (1., SSTHRESH_MAX, est_rtt, dev_rtt, max(est_rtt + 4 * dev_rtt, 0.1), 0, True, b"")
+        self.requests_in_flight[flow_id] = InFlightRequests()
+        self.other_ends[flow_id] = flow["destination"]
 
     def delete_flow(self, flow_id):
         """
         Delete the flow from the congestion controller
         """
-        del self.congestion_windows[flow_id]
-        del self.estimated_rtt[flow_id]
-        del self.dev_rtt[flow_id]
+        self._free.append(self._idx.pop(flow_id))
         del self.requests_in_flight[flow_id]
         del self.other_ends[flow_id]
-        del self.consecutive_acks[flow_id]
-        del self.ssthresh[flow_id]
-        del self.is_slow_start[flow_id]
 
     def collect_timeouts(self, current_time):
         """
         Collect the timeouts for the requests in flight and update the congestion windows for the involved flows
         """
-        for flow_id in self.requests_in_flight:
-            timed_out = False
-            requests = self.requests_in_flight[flow_id]
-            new_requests = []
-            for req_id, time_sent, timeout in requests:
-                if current_time - time_sent > timeout:
-                    # the request has timed out
-                    # we have to halve the congestion window
-                    timed_out = True
-                else:
-                    new_requests.append((req_id, time_sent, timeout))
-            self.requests_in_flight[flow_id] = new_requests
-            if timed_out:
-                """
-                sim_log.info(
-                f"Flow {flow_id} timed out {len(requests) - len(new_requests)} times, halving congestion window {self.congestion_windows[flow_id]}")
-                """
-                self.halve_congestion_knob(flow_id)
-                pass
+        flow_ids = list(self.requests_in_flight)
+        queues = list(self.requests_in_flight.values())
+        timed_out = count_timed_out(queues, current_time)
+        for k in np.flatnonzero(timed_out):
+            # drop the requests that have timed out, we have to halve the congestion window
+            flow_id = flow_ids[k]
+            queues[k].drop_timed_out(current_time)
+            """
+            sim_log.info(
+            f"Flow {flow_id} timed out {timed_out[k]} times, halving congestion window {self.cwnd[self._idx[flow_id]]}")
+            """
+            self.halve_congestion_knob(flow_id)
 
     def handle_ack(self, flow_id, req_id, current_time, time_sent, mark_congested=False):
         """
@@ -201,64 +496,38 @@ class WindowCongestionController(AIMDCongestionController):
         int
             The number of new requests to generate for the flow
         """
-        num_skipped = 0
-
-        found = False
-
-        # update the estimated RTT
+        requests = self.requests_in_flight[flow_id]
         sample_rtt = current_time - time_sent
-        self.estimated_rtt[flow_id] = 0.875 * self.estimated_rtt[flow_id] + 0.125 * sample_rtt
-        self.dev_rtt[flow_id] = 0.75 * self.dev_rtt[flow_id] + 0.25 * abs(sample_rtt - self.estimated_rtt[flow_id])
-        # print(f"Estimated RTT for flow {flow_id} is {self.estimated_rtt[flow_id]}, dev RTT is {self.dev_rtt[flow_id]}")
-
-        for req, time_sent, timeout in self.requests_in_flight[flow_id]:
-            if req < req_id:
-                num_skipped += 1
-                # if we receive an ACK for a request, we can remove all the requests with lower req_id
-                # because they have been surely dropped due to congestion
-            elif req == req_id:
-                # we found the request for which we received the ACK
-                # remove it from the list
-                found = True
-
-        if found:
-            # remove the tuples from the list
-            self.requests_in_flight[flow_id] = self.requests_in_flight[flow_id][num_skipped + 1:]
 
-        else:
-            self.requests_in_flight[flow_id] = self.requests_in_flight[flow_id][num_skipped:]
-            """
-            print(f"Flow {flow_id} received an ACK for a request that was not in flight, num_skipped={num_skipped}, "
-                  f"req_id={req_id}, requests_in_flight={self.requests_in_flight[flow_id]}")
-            """
-
-        if mark_congested:
+        if not mark_congested:
+            # try the in-order ACK fast path first
+            num_new_requests = window_ack_fastpath(
+                self._idx, flow_id, self.est_rtt, self.dev_rtt, self.rto, self.cwnd, self.ssthresh,
+                self.slow_start, self.cons_acks, requests.req_ids, requests.head, requests.tail, requests.mask, req_id,
+                sample_rtt, self.consecutive_acks_required, self.max_congestion_window)
+            if num_new_requests >= 0:
+                requests.head += 1
+                return num_new_requests
+
+        # the messages are only formatted when the log level lets them through
+        elif sim_log.logger.isEnabledFor(logging.WARNING):
             sim_log.warning(f"Flow {flow_id} marked as congested")
-            self.halve_congestion_knob(flow_id)
-
-        elif num_skipped > 0:
-            # sim_log.error(f"Flow {flow_id} marked as congested due to losses")
-            self.halve_congestion_knob(flow_id)
 
-        if num_skipped > 0 or mark_congested:
-            self.consecutive_acks[flow_id] = 0
-
-        # we increase the congestion window
-        if found:
-            self.consecutive_acks[flow_id] += 1
-        if self.consecutive_acks[flow_id] == self.consecutive_acks_required:
-            self.increase_congestion_knob(flow_id)
-            self.consecutive_acks[flow_id] = 0
+        # the RTT update, the removal of the ACKed request and of the skipped ones (surely dropped due to
+        # congestion), the halving on congestion and the window increase all run in the compiled window_ack
+        requests.head, num_new_requests = window_ack(
+            self._idx, flow_id, self.est_rtt, self.dev_rtt, self.rto, self.cwnd, self.ssthresh, self.slow_start,
+            self.cons_acks, requests.req_ids, requests.head, requests.tail, requests.mask, req_id,
+            sample_rtt, bool(mark_congested), self.consecutive_acks_required, self.max_congestion_window)
 
         # return the number of new requests to generate
-        return max(int(self.congestion_windows[flow_id]) - len(self.requests_in_flight[flow_id]), 0)
+        return num_new_requests
 
     def handle_new_request_in_flight(self, flow_id, req_id, current_time):
         """
         Handle a new request in flight for the given flow
         """
-        timeout = max(self.estimated_rtt[flow_id] + 4 * self.dev_rtt[flow_id], 0.1)
-        self.requests_in_flight[flow_id].append((req_id, current_time, timeout))
+        self.requests_in_flight[flow_id].append(req_id, current_time, self.rto[self._idx[flow_id]])
 
     def get_congestion_window(self, flow_id):
         """
@@ -266,10 +535,16 @@ class WindowCongestionController(AIMDCongestionController):
 
         Returns
         -------
-        int
+        float
             The congestion window size
         """
-        return self.congestion_windows[flow_id]
+        return float(self.cwnd[self._idx[flow_id]])
+
+    def get_estimated_rtt(self, flow_id):
+        """
+        Get the estimated RTT (us) for the given flow
+        """
+        return float(self.est_rtt[self._idx[flow_id]])
 
 
 class RateCongestionController(AIMDCongestionController):
@@ -280,28 +555,42 @@ class RateCongestionController(AIMDCongestionController):
 
     Additive Increase: increase the rate with a constant slope over time
     Multiplicative Decrease: halve the rate when a congestion event is detected
+
+    Flow ids are small non-negative integers, so the per-flow variables are lists indexed directly by flow_id (no
+    hashing on the hot path). The flows currently set up are the keys of ``requests_in_flight``.
     """
 
     def __init__(self, C=50000000):
-        self.congestion_knobs = {}  # dictionary of congestion knobs, one for each flow, indexed by flow_id
-        self.ssthresh = {}  # dictionary of slow start thresholds, one for each flow, indexed by flow_id
-        self.is_slow_start = {}  # dictionary of flags indicating if the flow is in slow start, indexed by flow_id
-        self.last_update = {}  # dictionary of last update times, one for each flow, indexed by flow_id
-        self.last_halved = {}  # dictionary of last halved times, one for each flow, indexed by flow_id
+        self.congestion_knobs = []  # congestion knobs, one for each flow, indexed by flow_id
+        self.ssthresh = []  # slow start thresholds, one for each flow, indexed by flow_id
+        self.is_slow_start = []  # flags indicating if the flow is in slow start, indexed by flow_id
+        self.last_update = []  # last update times, one for each flow, indexed by flow_id
+        self.last_halved = []  # last halved times, one for each flow, indexed by flow_id
         self.other_ends = {}  # dictionary of other end identifiers, one for each flow, indexed by flow_id
-        self.C = {}  # dictionary of C values, one for each flow, indexed by flow_id
+        self.C = []  # C values, one for each flow, indexed by flow_id
         self.default_C = C  # default C value
 
         self.initial_congestion_knob = 48000  # initial congestion knob (IRG), (us)
         self.max_ssthresh = 1024000  # maximum slow start threshold
 
-        self.estimated_rtt = {}
-        self.dev_rtt = {}
-        self.requests_in_flight = {}  # dictionary of requests in flight, one list for each flow, indexed by flow_id
-        # every element in the list is a tuple (req_id, time_sent, timeout)
+        self.estimated_rtt = []
+        self.dev_rtt = []
+        self.rto = []  # timeouts of the new requests, estimated_rtt + 4 * dev_rtt, refreshed with the estimates
+        self.requests_in_flight = {}  # dictionary of requests in flight, one InFlightRequests for each flow,
+        # indexed by flow_id
 
         super().__init__()
 
+    def _reserve(self, flow_id):
+        """
+        Extend the per-flow lists so that flow_id is a valid index
+        """
+        missing = flow_id + 1 - len(self.congestion_knobs)
+        if missing > 0:
+            for values in (self.congestion_knobs, self.ssthresh, self.is_slow_start, self.last_update,
+                           self.last_halved, self.C, self.estimated_rtt, self.dev_rtt, self.rto):
+                values.extend([None] * missing)
+
     def halve_congestion_knob(self, flow_id, current_time=None):
         """
         Halve the congestion knob (rate in this case) for the given flow
@@ -309,7 +598,8 @@ class RateCongestionController(AIMDCongestionController):
 
         # if last half was less than 3RTT ago, do not halve again
         if current_time - self.last_halved[flow_id] < 3*self.estimated_rtt[flow_id]:
-            sim_log.debug(f"Flow {flow_id} congestion knob halved ({current_time - self.last_update[flow_id]}) less than an RTT ({self.estimated_rtt[flow_id]}) ago ), not halving again")
+            if sim_log.logger.isEnabledFor(logging.DEBUG):
+                sim_log.debug(f"Flow {flow_id} congestion knob halved ({current_time - self.last_update[flow_id]}) less than an RTT ({self.estimated_rtt[flow_id]}) ago ), not halving again")
             return
 
         self.ssthresh[flow_id] = min(self.congestion_knobs[flow_id] * 4, self.max_ssthresh)
@@ -319,7 +609,8 @@ class RateCongestionController(AIMDCongestionController):
         self.last_halved[flow_id] = current_time
         self.is_slow_start[flow_id] = True
 
-        sim_log.info(f"Flow {flow_id} congestion knob halved to {self.congestion_knobs[flow_id]} with ss thresh {self.ssthresh[flow_id]}")
+        if sim_log.logger.isEnabledFor(logging.INFO):
+            sim_log.info(f"Flow {flow_id} congestion knob halved to {self.congestion_knobs[flow_id]} with ss thresh {self.ssthresh[flow_id]}")
         if current_time is None:
             raise ValueError("Current time must be provided with the rate based controller")
 
@@ -330,7 +621,7 @@ class RateCongestionController(AIMDCongestionController):
         if current_time is None:
             raise ValueError("Current time must be provided with the rate based controller")
         # elapsed_time = current_time - self.last_update[flow_id]  # us
-        if flow_id not in self.is_slow_start:
+        if flow_id not in self.requests_in_flight:
             raise ValueError(f"Flow {flow_id} not in the congestion controller")
         if not self.is_slow_start[flow_id]:
             new_IRG = (self.C[flow_id] * self.congestion_knobs[flow_id]) / (self.C[flow_id] + self.congestion_knobs[flow_id])
@@ -353,52 +644,43 @@ class RateCongestionController(AIMDCongestionController):
         """
         if current_time is None:
             raise ValueError("Current time must be provided with the rate based controller")
-        self.congestion_knobs[flow["flow_id"]] = self.initial_congestion_knob  # initial congestion knob (IPG), (us)
-        self.last_update[flow["flow_id"]] = current_time
-        self.last_halved[flow["flow_id"]] = current_time
-        self.other_ends[flow["flow_id"]] = flow["destination"] if is_source else flow["source"]
-        self.ssthresh[flow["flow_id"]] = 1200.  # initial slow start threshold
-        self.is_slow_start[flow["flow_id"]] = True
-
-        self.estimated_rtt[flow["flow_id"]] = 300 * (len(flow["path"]) - 1) * 10  # 3000 us per hop is the initial value
-        self.dev_rtt[flow["flow_id"]] = 0.05 * self.estimated_rtt[flow["flow_id"]]  # 5% of the estimated RTT
-        self.requests_in_flight[flow["flow_id"]] = []
-        self.C[flow["flow_id"]] = self.default_C
+        flow_id = flow["flow_id"]
+        self._reserve(flow_id)
+        self.congestion_knobs[flow_id] = self.initial_congestion_knob  # initial congestion knob (IPG), (us)
+        self.last_update[flow_id] = current_time
+        self.last_halved[flow_id] = current_time
+        self.other_ends[flow_id] = flow["destination"] if is_source else flow["source"]
+        self.ssthresh[flow_id] = 1200.  # initial slow start threshold
+        self.is_slow_start[flow_id] = True
+
+        est_rtt = 3000 * (len(flow["path"]) - 1)  # 3000 us per hop is the initial value
+        dev_rtt = 0.05 * est_rtt  # 5% of the estimated RTT
+        self.estimated_rtt[flow_id] = est_rtt
+        self.dev_rtt[flow_id] = dev_rtt
+        self.rto[flow_id] = max(est_rtt + 4 * dev_rtt, 0.1)
+        self.requests_in_flight[flow_id] = InFlightRequests()
+        self.C[flow_id] = self.default_C
 
     def delete_flow(self, flow_id):
         """
         Delete the flow from the congestion controller
         """
-        del self.congestion_knobs[flow_id]
-        del self.estimated_rtt[flow_id]
-        del self.dev_rtt[flow_id]
+        # the slots of the flow in the per-flow lists are left as they are, and reset if the flow_id is set up again
         del self.requests_in_flight[flow_id]
         del self.other_ends[flow_id]
-        del self.last_update[flow_id]
-        del self.last_halved[flow_id]
-        del self.ssthresh[flow_id]
-        del self.is_slow_start[flow_id]
 
     def collect_timeouts(self, current_time):
         """
         Collect the timeouts for the requests in flight and update the congestion knobs for the involved flows
         """
-        for flow_id in self.last_update:
-            timed_out = False
-            requests = self.requests_in_flight[flow_id]
-            new_requests = []
-            for req_id, time_sent, timeout in requests:
-                if current_time - time_sent > timeout:
-                    # the request has timed out
-                    # we have to halve the congestion knob
-                    timed_out = True
-                else:
-                    new_requests.append((req_id, time_sent, timeout))
-            self.requests_in_flight[flow_id] = new_requests
-            if timed_out:
-                # sim_log.info(f"Flow {flow_id} timed out {len(requests) - len(new_requests)} times, halving congestion knob {self.congestion_knobs[flow_id]}")
-                # self.halve_congestion_knob(flow_id, current_time)
-                pass
+        flow_ids = list(self.requests_in_flight)
+        queues = list(self.requests_in_flight.values())
+        timed_out = count_timed_out(queues, current_time)
+        for k in np.flatnonzero(timed_out):
+            # drop the requests that have timed out
+            queues[k].drop_timed_out(current_time)
+            # sim_log.info(f"Flow {flow_ids[k]} timed out {timed_out[k]} times, halving congestion knob {self.congestion_knobs[flow_ids[k]]}")
+            # self.halve_congestion_knob(flow_ids[k], current_time)
 
     def handle_ack(self, flow_id, req_id, current_time, time_sent, mark_congested=False):
         """
@@ -423,44 +705,39 @@ class RateCongestionController(AIMDCongestionController):
             The number of new requests to generate for the flow
         """
 
-        num_skipped = 0
-
-        found = False
-
         # update the estimated RTT
         sample_rtt = current_time - time_sent
         self.estimated_rtt[flow_id] = 0.875 * self.estimated_rtt[flow_id] + 0.125 * sample_rtt
-        self.dev_rtt[flow_id] = 0.75 * self.dev_rtt[flow_id] + 0.25 * abs(sample_rtt - self.estimated_rtt[flow_id])
+        self.dev_rtt[flow_id] = 0.75 * self.dev_rtt[flow_id] + 0.25 * fabs(sample_rtt - self.estimated_rtt[flow_id])
+        self.rto[flow_id] = max(self.estimated_rtt[flow_id] + 4 * self.dev_rtt[flow_id], 0.1)
         self.C[flow_id] = self.estimated_rtt[flow_id]*4000
         # print(f"Estimated RTT for flow {flow_id} is {self.estimated_rtt[flow_id]}, dev RTT is {self.dev_rtt[flow_id]}, C is {self.C}")
 
-        for req, time_sent, timeout in self.requests_in_flight[flow_id]:
-            if req < req_id:
-                num_skipped += 1
-                # if we receive an ACK for a request, we can remove all the requests with lower req_id
-                # because they have been surely dropped due to congestion
-            elif req == req_id:
-                # we found the request for which we received the ACK
-                # remove it from the list
-                found = True
+        # if we receive an ACK for a request, we can remove all the requests with lower req_id
+        # because they have been surely dropped due to congestion
+        requests = self.requests_in_flight[flow_id]
+        num_skipped, found = requests.bisect_ack(req_id)
 
         if found:
-            # remove the tuples from the list
-            self.requests_in_flight[flow_id] = self.requests_in_flight[flow_id][num_skipped + 1:]
+            # we found the request for which we received the ACK, remove it as well
+            requests.pop_front(num_skipped + 1)
 
         else:
-            self.requests_in_flight[flow_id] = self.requests_in_flight[flow_id][num_skipped:]
+            requests.pop_front(num_skipped)
             """
             print(f"Flow {flow_id} received an ACK for a request that was not in flight, num_skipped={num_skipped}, "
-                  f"req_id={req_id}, requests_in_flight={self.requests_in_flight[flow_id]}")
+                  f"req_id={req_id}, requests_in_flight={len(requests)}")
             """
 
+        # the messages are only formatted when the log level lets them through
         if mark_congested:
-            sim_log.warning(f"Flow {flow_id} marked as congested")
+            if sim_log.logger.isEnabledFor(logging.WARNING):
+                sim_log.warning(f"Flow {flow_id} marked as congested")
             self.halve_congestion_knob(flow_id, current_time)
 
         elif num_skipped > 0:
-            sim_log.error(f"Flow {flow_id} marked as congested due to losses")
+            if sim_log.logger.isEnabledFor(logging.ERROR):
+                sim_log.error(f"Flow {flow_id} marked as congested due to losses")
             self.halve_congestion_knob(flow_id, current_time)
 
         # return the number of new requests to generate. 0 with a rate-based controller
@@ -476,10 +753,31 @@ class RateCongestionController(AIMDCongestionController):
         """
         Handle a new request in flight for the given flow
         """
-        timeout = max(self.estimated_rtt[flow_id] + 4 * self.dev_rtt[flow_id], 0.1)
-        self.requests_in_flight[flow_id].append((req_id, current_time, timeout))
+        self.requests_in_flight[flow_id].append(req_id, current_time, self.rto[flow_id])
 
     def increase_all_knobs(self, current_time):
-        for flow_id in self.last_update:
-            self.increase_congestion_knob(flow_id, current_time)
+        """
+        Increase the congestion knobs of all the flows, see :meth:`increase_congestion_knob`. The flows in slow start
+        and the ones past it are updated with one vectorized expression each.
+        """
+        if current_time is None:
+            raise ValueError("Current time must be provided with the rate based controller")
+        flow_ids = list(self.requests_in_flight)
+        if not flow_ids:
+            return
+        knobs = np.array([self.congestion_knobs[flow_id] for flow_id in flow_ids], dtype=np.float64)
+        C = np.array([self.C[flow_id] for flow_id in flow_ids], dtype=np.float64)
+        ssthresh = np.array([self.ssthresh[flow_id] for flow_id in flow_ids], dtype=np.float64)
+        slow = np.array([self.is_slow_start[flow_id] for flow_id in flow_ids], dtype=bool)
+
+        cong = ~slow
+        knobs[slow] /= 1.1
+        knobs[cong] = (C[cong] * knobs[cong]) / (C[cong] + knobs[cong])
+        # the flows in slow start leave it when the knob (IRG) reaches the slow start threshold
+        slow &= knobs > ssthresh
+
+        for flow_id, knob, is_slow in zip(flow_ids, knobs.tolist(), slow.tolist()):
+            self.congestion_knobs[flow_id] = knob
+            self.is_slow_start[flow_id] = is_slow
+            self.last_update[flow_id] = current_time
 
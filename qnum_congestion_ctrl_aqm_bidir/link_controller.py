@@ -1,8 +1,8 @@
 from omnetpypy import SimpleModule, Message, sim_log
 from qnum_congestion_ctrl_aqm_bidir import messages
-from qnum_congestion_ctrl_aqm_bidir.messages import RoutablePacket, EntanglementGenPacket, \
-    FlowsInformationPacket, FlowDeletionPacket
-from qnum_congestion_ctrl_aqm_bidir.utility import sanitize_flow_descriptors
+from qnum_congestion_ctrl_aqm_bidir.messages import EntanglementGenPacket, FlowsInformationPacket, \
+    FlowDeletionPacket
+from qnum_congestion_ctrl_aqm_bidir.utility import get_flow_descriptors
 
 
 class LinkController(SimpleModule):
@@ -10,6 +10,9 @@ class LinkController(SimpleModule):
     This class models a Link Controller, placed in the middle of a link.
     """
 
+    TRIGGER_HEADER = "trigger"
+    ENTANGLEMENT_READY_HEADER = "entanglement ready"
+
     def __init__(self, name, identifier, t_clock):
         port_names = ["lc0", "lc1"]
 
@@ -24,9 +27,26 @@ class LinkController(SimpleModule):
 
         self._flow_directions = {}
 
-        self._trigger_msg = Message(["trigger attempt"], header="trigger")
+        self._trigger_msg = Message(["trigger attempt"], header=self.TRIGGER_HEADER)
 
         self._cur_lle_id = 0
+        self._lle_id_prefix = self.name + "-"
+        # LLE identifiers are "<link controller name>-<counter>"
+
+        self._geometric = None
+        # geometric sampler of the default numpy generator (generator = 0), bound in initialize
+        self._random = None
+        # uniform sampler of the simulation rng (generator = 0 by default), bound in initialize
+
+        self._cached_queues = None
+        # (left queue, right queue) of the adjacent nodes, resolved lazily by _get_queues_info
+
+        self._link_pos_cache = {}
+        # position on the flow path of the link controlled by this link controller, indexed by flow_id
+
+        self._dispatch = {FlowsInformationPacket.HEADER: self._receive_flows_information,
+                          FlowDeletionPacket.HEADER: self._receive_flow_deletion}
+        # handlers of the packets addressed to this link controller, indexed by header
 
     def initialize(self, step=0):
         if step == 0:
@@ -36,9 +56,12 @@ class LinkController(SimpleModule):
             first_attempt_time = self.sim_context.rng.random(generator=0) * self.t_clock
             self.schedule_message(self._trigger_msg, delay=first_attempt_time)
 
+            # rng.geometric only forwards to the numpy generator, sample the number of attempts from it directly
+            self._geometric = self.sim_context.rng.numpy_generators[0].geometric
+            self._random = self.sim_context.rng.random
+
             # access global parameters and get the flows information
-            flow_descriptors = self.sim_context.global_params["flow_descriptors"]
-            flow_descriptors = sanitize_flow_descriptors(flow_descriptors)
+            flow_descriptors = get_flow_descriptors(self.sim_context.global_params)
             # dict of flow descriptors, indexed by flow_id, each one containing the following fields (for now):
             # - flow_id
             # - source
@@ -52,36 +75,33 @@ class LinkController(SimpleModule):
 
     def _attempt_entanglement(self):
 
-        # In this first implementation, we update the flow probabilities right before each attempt, because we have
-        # perfect, real-time information on the queues at the adjacent nodes. In future implementations, we will use a
-        # more realistic approach where we update the flow probabilities at regular intervals with reduced information.
-        self._update_flow_probabilities()
+        # In this first implementation, we would update the flow probabilities right before each attempt, because we
+        # have perfect, real-time information on the queues at the adjacent nodes. In future implementations, we will
+        # use a more realistic approach where we update the flow probabilities at regular intervals with reduced
+        # information. _update_flow_probabilities is not implemented yet, so it is not called on every attempt: call
+        # it here again once it does something.
 
         queues_info = self._get_queues_info()
+        t_clock = self.t_clock
 
-        # check whether the queues are empty. if so, we don't attempt entanglement
-        if queues_info[0].is_empty() and queues_info[1].is_empty():
-            self.schedule_message(self._trigger_msg, delay=self.t_clock)
-            return
-
-        rng = self.sim_context.rng
+        # get queues length and the request each of them would serve, the left queue serves port q1 and the right
+        # queue serves port q0
+        left = queues_info[0].snapshot(out_port="q1", policy="OLDEST")
+        right = queues_info[1].snapshot(out_port="q0", policy="OLDEST")
+        total = left.length + right.length
 
         """# first we pick a flow to attempt entanglement for using the flow probabilities
 
-        # now we get the flows for which queues are not empty
-        flows = [flow_id for flow_id in self._flow_probabilities.keys() if not queues_info[0].is_empty(flow_id)]
-
-        # we filter out flows whose direction is not upstream
-        flows = [flow_id for flow_id in flows if self._flow_directions[flow_id] == "upstream"]
-
-        flows_down = [flow_id for flow_id in self._flow_probabilities.keys() if not queues_info[1].is_empty(flow_id)]
+        # now we get the upstream flows whose queue on the left is not empty and the downstream flows whose queue on
+        # the right is not empty
+        direction_of = self._flow_directions.__getitem__
+        flows = [flow_id for flow_id in self._flow_probabilities.keys()
+                 if direction_of(flow_id) == "upstream" and not queues_info[0].is_empty(flow_id=flow_id)]
+        flows_down = [flow_id for flow_id in self._flow_probabilities.keys()
+                      if direction_of(flow_id) == "downstream" and not queues_info[1].is_empty(flow_id=flow_id)]
 
-        # we filter out flows whose direction is not downstream
-        flows_down = [flow_id for flow_id in flows_down if self._flow_directions[flow_id] == "downstream"]
-
-        flows += flows_down
-        # remove duplicates
-        assert len(list(set(flows))) == len(flows)
+        # remove duplicates in one pass, keeping the order (rng.choices depends on it)
+        flows = list(dict.fromkeys(flows + flows_down))
 
         # check whether flows is empty. if so, we don't attempt entanglement
         if len(flows) == 0:
@@ -94,60 +114,53 @@ class LinkController(SimpleModule):
         flows_probabilities = [p / summed for p in flows_probabilities]
 
         # we pick the flow_id using the flow probabilities and the default rng (generator = 0)
-        flow_id = rng.choices(sequence=flows,
-                              weights=flows_probabilities,
-                              k=1,
-                              generator=0)[0]"""
-
-        # flip a coin to decide which queue to peek
-        left_is_owner = False
+        flow_id = self.sim_context.rng.choices(sequence=flows,
+                                               weights=flows_probabilities,
+                                               k=1,
+                                               generator=0)[0]"""
 
-        # get queues length
-        q0_len = queues_info[0].length()
-        q1_len = queues_info[1].length()
+        req = None
+        # if the queues are empty, we don't attempt entanglement
+        if total > 0:
+            # flip a coin, weighted by the queue lengths, to decide which queue to peek
+            left_is_owner = self._random(generator=0) * total < left.length
 
-        left_prob = q0_len / (q0_len + q1_len)
+            req = left.request if left_is_owner else right.request
 
-        if rng.random(generator=0) < left_prob:
-            queue = 0
-            req, oldest_time = queues_info[0].peek_request(out_port="q1", policy="OLDEST")
-            left_is_owner = True
-        else:
-            queue = 1
-            req, oldest_time = queues_info[1].peek_request(out_port="q0", policy="OLDEST")
+            if req is None:
+                # try the other queue
+                req = right.request if left_is_owner else left.request
+                left_is_owner = not left_is_owner
 
         if req is None:
-            # try the other queue
-            queue = 1 - queue
-            req, oldest_time = queues_info[queue].peek_request(out_port="q0" if queue == 1 else "q1", policy="OLDEST")
-            left_is_owner = not left_is_owner
-
-        if req is None:
-            self.schedule_message(self._trigger_msg, delay=self.t_clock)
+            # nothing to attempt, try again at the next clock tick
+            self.schedule_message(self._trigger_msg, delay=t_clock)
             return
         flow_id = req.flow_id
 
         # use a geometric distribution to determine the number of attempts needed
-        attempts = rng.geometric(p=self._flow_attempt_probabilities[flow_id], generator=0)
+        attempts = self._geometric(self._flow_attempt_probabilities[flow_id])
 
         # create a self message
-        self_msg = Message([flow_id, left_is_owner], header="entanglement ready")
+        self_msg = Message([flow_id, left_is_owner], header=self.ENTANGLEMENT_READY_HEADER)
         # wait for the number of attempts
-        self.schedule_message(self_msg, delay=attempts * self.t_clock)
+        self.schedule_message(self_msg, delay=attempts * t_clock)
 
     def _handle_successful_entanglement(self, message):
 
         flow_id = message.fields[0]
         left_is_owner = message.fields[1]
 
-        lle_id = self.name + "-" + str(self._cur_lle_id)
+        lle_id = f"{self._lle_id_prefix}{self._cur_lle_id}"
         # debug: check that the request we picked is indeed the oldest in the queue for that port name
         # print(f"Here {self.name} for {lle_id} : Request {req} is the oldest ({oldest_time}) in the queue on port q{1 - queue}")
         # print(queues_info[queue]._requests)
-        self.send(EntanglementGenPacket(flow_id=flow_id, lle_id=lle_id, sender_name=self.name,
-                                        owner=left_is_owner), "lc0")
-        self.send(EntanglementGenPacket(flow_id=flow_id, lle_id=lle_id, sender_name=self.name,
-                                        owner=not left_is_owner), "lc1")
+        # the two packets only differ in the owner: build one and copy it for the other side
+        left_pkt = EntanglementGenPacket(flow_id=flow_id, lle_id=lle_id, sender_name=self.name, owner=left_is_owner)
+        right_pkt = left_pkt.__copy__()
+        right_pkt.meta["owner"] = not left_is_owner
+        self.send(left_pkt, "lc0")
+        self.send(right_pkt, "lc1")
         self._cur_lle_id += 1
 
         # we schedule the next attempt
@@ -164,67 +177,87 @@ class LinkController(SimpleModule):
         # where we send messages to the adjacent nodes asking for their queue status.
         # TODO
 
+        # the topology is static, so the crawl is done once and its result reused on every attempt
+        if self._cached_queues is not None:
+            return self._cached_queues
+
         # veeeeeery ugly and unsafe
         node_right = self.ports["lc1"].connected_port.parent.ports["B"].connected_port.parent
         node_left = self.ports["lc0"].connected_port.parent.ports["A"].connected_port.parent
 
-        return node_left.req_queue, node_right.req_queue
+        self._cached_queues = (node_left.req_queue, node_right.req_queue)
+        return self._cached_queues
 
     def _update_flow_probabilities(self):
         """
         Update the flow probabilities based on the information on the queues at the adjacent nodes.
+
+        Not implemented yet, hence not called by _attempt_entanglement.
         """
         # First implementation: use _get_queues_info to get the queues status and update the flow probabilities based
         # on the number of requests in the queues.
         # TODO
-        pass
 
     def handle_message(self, message, port_name):
+        meta = message.meta
+        header = meta.get("header")
 
-        if isinstance(message, FlowsInformationPacket) and message.destination == self.name:
-            sim_log.debug(f"{self.name} received flows information with {len(message.flows)} flows.",
-                          time=self.sim_context.time())
-            self._handle_flows_information(message)
+        handler = self._dispatch.get(header)
+        if handler is not None and meta.get("destination") == self.name:
+            handler(message)
             return
 
-        if isinstance(message, FlowDeletionPacket) and message.destination == self.name:
-            sim_log.debug(f"{self.name} received flow deletion for flow {message.flow_id}.",
-                          time=self.sim_context.time())
-            self._handle_flow_deletion(message)
-            return
-
-        if port_name is not None and isinstance(message, RoutablePacket):
-            # if this is not the destination, forward the packet on the other port
-            if message.destination != self.name:
+        if port_name is not None:
+            # if this is a routable packet and we are not the destination, forward the packet on the other port
+            if "destination" in meta and meta["destination"] != self.name:
                 # print(f"{self.name} forwarding message {message} to {port_name} at time {self.sim_context.time()}")
                 self.send(message, "lc1" if port_name == "lc0" else "lc0")
                 return
 
-        elif port_name is None:  # self message, we need to attempt entanglement
-            if "header" in message.meta and message.meta["header"] == self._trigger_msg.meta["header"]:
+        else:  # self message, we need to attempt entanglement
+            if header == self.TRIGGER_HEADER:
                 self._attempt_entanglement()
-            elif "header" in message.meta or message.meta["header"] == "entanglement ready":
+            elif header == self.ENTANGLEMENT_READY_HEADER:
                 self._handle_successful_entanglement(message)
             else:
                 raise ValueError("Unknown self message received")
 
+    def _receive_flows_information(self, message):
+        sim_log.debug(f"{self.name} received flows information with {len(message.flows)} flows.",
+                      time=self.sim_context.time())
+        self._handle_flows_information(message)
+
+    def _receive_flow_deletion(self, message):
+        sim_log.debug(f"{self.name} received flow deletion for flow {message.flow_id}.",
+                      time=self.sim_context.time())
+        self._handle_flow_deletion(message)
+
     def _handle_flows_information(self, message):
+        # new flows information may come with a different topology, resolve the adjacent queues again
+        self._cached_queues = None
+        if not message.flows:
+            return
+        equal_prob = 1 / len(message.flows)  # begin with equal probabilities for all flows
         for flow in message.flows:
-            if self.name not in flow["path"]:
+            path = flow["path"]
+            if self.name not in path:
                 continue
             flow_id = flow["flow_id"]
-            self._flow_probabilities[flow_id] = 1 / len(message.flows)  # begin with equal probabilities for all flows
+            link_pos = self._link_pos_cache.get(flow_id)
+            if link_pos is None:
+                # find our position on the flow path
+                idx = path.index(self.name)
+                # the path is node0---(link_first_half)---link_controller---(link_second_half)---node1...
+                # the link controller is attached to link_first_half and link_second_half
+                # find link position (first + second halves are one link) on the path that this link controller controls
+                link_pos = (idx - 1) // 2
+                self._link_pos_cache[flow_id] = link_pos
+
+            self._flow_probabilities[flow_id] = equal_prob
 
             # store the flow direction
             self._flow_directions[flow_id] = flow["direction"]
 
-            # find our position on the flow path
-            path = flow["path"]
-            idx = path.index(self.name)
-            # the path is node0---(link_first_half)---link_controller---(link_second_half)---node1...
-            # the link controller is attached to link_first_half and link_second_half
-            # find link position (first + second halves are one link) on the path that this link controller controls
-            link_pos = int((idx - 1) / 2)
             # get the success probability for the link
             success_prob = flow["success_probs"][link_pos]
             # update the flow probabilities
@@ -237,6 +270,7 @@ class LinkController(SimpleModule):
             del self._flow_probabilities[flow_id]
             del self._flow_attempt_probabilities[flow_id]
             del self._flow_directions[flow_id]
+            self._link_pos_cache.pop(flow_id, None)
         else:
             sim_log.warning(f"Flow {flow_id} not found in the flow probabilities of {self.name}.",
                             time=self.sim_context.time())
@@ -1,3 +1,5 @@
+from array import array
+
 from omnetpypy import Message
 
 
@@ -8,6 +10,9 @@ class RoutablePacket(Message):
     The only constraint to the packet is that it must have a specified destination in its meta.
     """
 
+    # packets keep all their state in the fields and meta of Message, they add no instance attributes of their own
+    __slots__ = ()
+
     def __init__(self, destination, fields, **meta):
         meta["destination"] = destination
         super().__init__(fields, **meta)
@@ -42,6 +47,7 @@ class FlowsInformationPacket(RoutablePacket):
     """
 
     HEADER = "FLOWS INFORMATION"
+    __slots__ = ()
 
     def __init__(self, flows, destination, **meta):
         meta["header"] = FlowsInformationPacket.HEADER
@@ -53,9 +59,11 @@ class FlowsInformationPacket(RoutablePacket):
         return self.fields[0]
 
     def __copy__(self):
-        new_meta = self.meta.copy()
-        flows_cpy = [desc.copy() for desc in self.flows]
-        return FlowsInformationPacket(flows=flows_cpy, **new_meta)
+        # skip the __init__ chain, only the flow descriptors need to be copied
+        ret = FlowsInformationPacket.__new__(FlowsInformationPacket)
+        ret.fields = [[desc.copy() for desc in self.flows]]
+        ret.meta = self.meta.copy()
+        return ret
 
 
 class FlowDeletionPacket(RoutablePacket):
@@ -70,6 +78,7 @@ class FlowDeletionPacket(RoutablePacket):
     """
 
     HEADER = "FLOW DELETION"
+    __slots__ = ()
 
     def __init__(self, flow_id, destination, **meta):
         meta["header"] = FlowDeletionPacket.HEADER
@@ -83,10 +92,14 @@ class FlowDeletionPacket(RoutablePacket):
 class EntanglementRequestPacket(RoutablePacket):
 
     HEADER = "ENTANGLEMENT REQUEST"
+    __slots__ = ()
 
     def __init__(self, req_id, destination, flow_id, lle_id, gen_time, wait_times=None, **meta):
+        # the wait times are stored as a compact array of doubles (8 bytes each, copied with a single memcpy)
         if wait_times is None:
-            wait_times = []
+            wait_times = array("d")
+        elif not isinstance(wait_times, array):
+            wait_times = array("d", wait_times)
         super().__init__(destination, fields=[req_id, flow_id, lle_id, gen_time, wait_times],
                          header=EntanglementRequestPacket.HEADER, congested_ECN=False, **meta)
 
@@ -145,17 +158,12 @@ class EntanglementRequestPacket(RoutablePacket):
         self.wait_times.append(wait_time)
 
     def __copy__(self):
-        new_meta = self.meta.copy()
-        del new_meta["destination"]
-        del new_meta["header"]
-        del new_meta["congested_ECN"]
-        fields_cpy = self.fields[:]
-        ret = EntanglementRequestPacket(req_id=fields_cpy[0], destination=self.destination,
-                                         flow_id=fields_cpy[1], lle_id=fields_cpy[2], wait_times=fields_cpy[3][:],
-                                         **new_meta)
-        if self.is_congested():
-            ret.mark_congested()
-
+        # skip the __init__ chain: the meta (destination, header, ECN mark) is copied as is and only the wait times
+        # array needs a copy of its own
+        fields = self.fields
+        ret = EntanglementRequestPacket.__new__(EntanglementRequestPacket)
+        ret.fields = [fields[0], fields[1], fields[2], fields[3], fields[4][:]]
+        ret.meta = self.meta.copy()
         return ret
 
     def update_request(self, lle_id=None, wait_time=None, destination=None):
@@ -168,7 +176,7 @@ class EntanglementRequestPacket(RoutablePacket):
         lle_id : int or None, optional
             The new lle_id
         wait_time : float or None, optional
-            The wait time for the last swapped lle, appended to the wait_times list
+            The wait time for the last swapped lle, appended to the wait_times array (must be a number)
         destination : str or None, optional
             The new destination for the request (next hop)
         """
@@ -187,11 +195,14 @@ class EntanglementGenPacket(Message):
     """
 
     HEADER = "ENTANGLEMENT GENERATION"
+    __slots__ = ()
 
     def __init__(self, flow_id, lle_id, sender_name, **meta):
+        # built once per successful entanglement: set the Message attributes directly, the meta collected by **meta is
+        # already a fresh dict owned by this packet and does not need to be unpacked and copied again by Message
         meta["header"] = EntanglementGenPacket.HEADER
-        fields = [flow_id, lle_id, sender_name]
-        super().__init__(fields, **meta)
+        self.fields = [flow_id, lle_id, sender_name]
+        self.meta = meta
 
     @property
     def flow_id(self):
@@ -205,6 +216,13 @@ class EntanglementGenPacket(Message):
     def sender_name(self):
         return self.fields[2]
 
+    def __copy__(self):
+        # skip the __init__ chain: the fields and meta are already in their final form
+        ret = EntanglementGenPacket.__new__(EntanglementGenPacket)
+        ret.fields = self.fields[:]
+        ret.meta = self.meta.copy()
+        return ret
+
 
 class EntanglementGenAcknowledgement(RoutablePacket):
     """
@@ -213,6 +231,7 @@ class EntanglementGenAcknowledgement(RoutablePacket):
     """
 
     HEADER = "ENTANGLEMENT GEN ACK"
+    __slots__ = ()
 
     def __init__(self, destination, flow_id, req_id, gen_time, congested=False, **meta):
         fields = [flow_id, req_id, gen_time, congested]
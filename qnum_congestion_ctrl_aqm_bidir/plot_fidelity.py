@@ -3,10 +3,12 @@ We plot here fidelity and secret key rate in the same way as we did for latency
 """
 
 import matplotlib.pyplot as plt
-import numpy as np
-import pandas as pd
+
+from qnum_congestion_ctrl_aqm_bidir.plot_utils import binary_entropy, decimate, init_backend, load_vector, \
+    moving_window_mean, moving_window_sum, steady_state_mean
 
 if __name__ == "__main__":
+    interactive = init_backend()
     fig, axs = plt.subplots(2, sharex=True)
     ax = axs[0]
     ax2 = axs[1]
@@ -24,30 +26,25 @@ if __name__ == "__main__":
     ax2.yaxis.set_label_coords(x=-0.09, y=0.5)
 
     # read also the file "latency_vector.csv" and plot a moving average of latency as a function of time in the same plot
-    df_fid = pd.read_csv("./out/fidelity_vector.csv")
+    ts_fid, fid = load_vector("./out/fidelity_vector.csv")
 
     # Compute the sliding window average
     window_size_time_units = 25000
 
-    # create a new column with the sliding window index
-    df_fid["sw_index"] = df_fid["timestamp"] // window_size_time_units
-
     # compute the sliding window average
-    sw_avg = pd.Series(
-        [df_fid[(df_fid["timestamp"] >= t - window_size_time_units) & (df_fid["timestamp"] < t)]["sample"].mean() for t
-         in df_fid["timestamp"]])
+    sw_avg = moving_window_mean(ts_fid, fid, window_size_time_units)
 
     # divide the timestamp by 1e3 to have ms
-    df_fid["timestamp"] /= 1e3
+    ts_ms = ts_fid / 1e3
 
     ax.set_ylim(0.4, 1)
 
     # ax2 = ax.twinx()
-    ax.plot(df_fid["timestamp"], sw_avg, color="red", label="E2E Fidelity")
+    ax.plot(*decimate(ts_ms, sw_avg), color="red", label="E2E Fidelity")
     # ax.set_ylabel("Latency (ms)")
 
     # still on ax2 print the average secret key rate for the second half of the simulation
-    ax.axhline(y=sw_avg[sw_avg.size//2:].mean(), color='red', linestyle='--',
+    ax.axhline(y=steady_state_mean(sw_avg), color='red', linestyle='--',
                 label="AVG E2E FID at steady state")
 
     """cur_flows = 4
@@ -73,36 +70,27 @@ if __name__ == "__main__":
         else:
             cur_flows += 6"""
 
-    # we obtain the secret key rate from df_fid by computing the secret key fraction for each sample
+    # we obtain the secret key rate from the fidelity by computing the secret key fraction for each sample
     # the secret key fraction is 1 - 2h(2(1-f)/3), where h is the binary entropy function and f is the fidelity
-    # read again the fidelity file
-    df_skr = pd.read_csv("./out/fidelity_vector.csv")
-
-    def binary_entropy(x):
-        return -x * np.log2(x) - (1-x) * np.log2(1-x)
-
-    df_skr["sample"] = 1 - 2 * binary_entropy(2 * (1 - df_skr["sample"]) / 3)
+    skr = 1 - 2 * binary_entropy(2 * (1 - fid) / 3)
     # replace negative values with 0
-    df_skr["sample"] = df_skr["sample"].clip(lower=0)
+    skr = skr.clip(min=0)
 
     # read the IRG file and plot the Inter-Request Gap (IRG) on the same plot but on a different axis
     window_size_time_units *= 5
-    # sw_avg_irg = pd.Series([df_irg[(df_irg["timestamp"] >= t - window_size_time_units) & (df_irg["timestamp"] < t)]["sample"].mean() for t in df_irg["timestamp"]])
-    sw_avg_skr = pd.Series(
-        [df_skr[(df_skr["timestamp"] >= t - window_size_time_units) & (df_skr["timestamp"] < t)]["sample"].sum() for t
-         in df_skr["timestamp"]])
+    # sw_avg_irg = pd.Series(moving_window_mean(df_irg["timestamp"], df_irg["sample"], window_size_time_units))
+    # NaN samples are skipped, as pandas' sum does
+    sw_avg_skr = moving_window_sum(ts_fid, skr, window_size_time_units)
     sw_avg_skr /= window_size_time_units  # pairs per us
     sw_avg_skr *= 1e3  # pairs per ms
 
-    df_skr["timestamp"] /= 1e3
-
-    ax2.plot(df_skr["timestamp"], sw_avg_skr, color="blue", label="E2E Secret Key Rate")
+    ax2.plot(*decimate(ts_ms, sw_avg_skr), color="blue", label="E2E Secret Key Rate")
     # ax2.set_ylabel("Inter-Request Gap (IRG) (ms)", color="blue")
     ax2.set_ylabel("E2E Secret Key Rate (bits/ms)", color="blue")
     # ax2.set_ylim(0, 2)
 
     # still on ax2 print the average secret key rate for the second half of the simulation
-    ax2.axhline(y=sw_avg_skr[sw_avg_skr.size//2:].mean(), color='blue', linestyle='--', label="AVG E2E SKR at steady state")
+    ax2.axhline(y=steady_state_mean(sw_avg_skr), color='blue', linestyle='--', label="AVG E2E SKR at steady state")
 
     # print the legends within the axis
 
@@ -118,7 +106,8 @@ if __name__ == "__main__":
     # adjust plot size
     fig.tight_layout()
 
-    plt.show()
+    if interactive:
+        plt.show()
 
     # save the figure
     fig.savefig("./out/fidelity_secret_key_rate.pdf")
\ No newline at end of file
@@ -2,19 +2,23 @@
 plot the congestion window from ./out/congestion_window_vector.csv as a function of time (ms)
 there is only one flow
 """
-import math
-
-import pandas as pd
 import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection, PolyCollection
 import numpy as np
 
+from qnum_congestion_ctrl_aqm_bidir.plot_utils import decimate, init_backend, load_vector, moving_window_count, \
+    section_means
+
+
 def compute_fid(latency, gamma):
     """
-    Compute the flow id from the latency and the gamma parameter
+    Compute the flow id from the latency and the gamma parameter, element-wise if latency is an array
     """
-    return 0.5 + 0.5*math.exp(-2*gamma*latency)
+    return 0.5 + 0.5*np.exp(-2*gamma*np.asarray(latency))
+
 
 if __name__ == "__main__":
+    interactive = init_backend()
 
     fig, axs = plt.subplots(2, sharex=True)
     ax = axs[0]
@@ -34,38 +38,32 @@ if __name__ == "__main__":
     ax2.yaxis.set_label_coords(x=-0.06, y=0.5)
 
     # read also the file "latency_vector.csv" and plot a moving average of latency as a function of time in the same plot
-    df_lat = pd.read_csv("./out/latency_vector.csv")
+    ts_lat, lat = load_vector("./out/latency_vector.csv")
 
     # Compute the sliding window average
     window_size_time_units = 80000
 
-    # create a new column with the sliding window index
-    df_lat["sw_index"] = df_lat["timestamp"] // window_size_time_units
-
     # compute the sliding window average
-    sw_avg = df_lat.groupby("sw_index").mean()
+    sw_avg_ts, sw_avg_lat = section_means(ts_lat, lat, window_size_time_units)
 
     # divide the timestamp and the sample by 1e3 to have ms
-    sw_avg["timestamp"] /= 1e3
-    sw_avg["sample"] /= 1e3
+    sw_avg_ts /= 1e3
+    sw_avg_lat /= 1e3
 
     # ax2 = ax.twinx()
-    ax.plot(sw_avg["timestamp"], sw_avg["sample"], color="red", label="latency")
+    ax.plot(sw_avg_ts, sw_avg_lat, color="red", label="latency")
     # ax.set_ylabel("Latency (ms)")
 
     cur_flows = 4
     delete_phase = False
     # create a colormap for the background
     colors = {4: "blue", 10: "yellow", 16: "red"}
-    for i in range(0, 48000, 8000):
-        ax.axvline(x=i, color='black', linestyle=':', alpha=0.5)
-        ax2.axvline(x=i, color='black', linestyle=':', alpha=0.5)
+    phase_starts = np.arange(0, 48000, 8000)
+    phase_flows = []
+    for i in phase_starts:
         # add some text next to the line saying "2 flows added" at the top
         ax.text(i + 1000, 80, f"{cur_flows} flows", rotation=0, fontsize=10)
-
-        # add a colored background
-        ax.axvspan(i, i + 8000, color=colors[cur_flows], alpha=0.1)
-        ax2.axvspan(i, i + 8000, color=colors[cur_flows], alpha=0.1)
+        phase_flows.append(cur_flows)
 
         if cur_flows == 16:
             delete_phase = True
@@ -76,18 +74,30 @@ if __name__ == "__main__":
         else:
             cur_flows += 6
 
+    # draw the phase boundaries and the colored backgrounds as one collection each per axis, spanning the whole
+    # axis height (x in data coordinates, y in axes coordinates) like axvline/axvspan do
+    boundaries = [[(i, 0), (i, 1)] for i in phase_starts]
+    backgrounds = [[(i, 0), (i, 1), (i + 8000, 1), (i + 8000, 0)] for i in phase_starts]
+    background_colors = [colors[n] for n in phase_flows]
+    for a in (ax, ax2):
+        a.add_collection(PolyCollection(backgrounds, facecolors=background_colors, edgecolors="none", alpha=0.1,
+                                        transform=a.get_xaxis_transform()))
+        a.add_collection(LineCollection(boundaries, colors="black", linestyles=":", alpha=0.5,
+                                        transform=a.get_xaxis_transform()))
+        a.update_datalim([(phase_starts[0], 0), (phase_starts[-1] + 8000, 0)], updatey=False)
+
 
     # read the throughput file and plot the throughput as a sliding window average
-    df_irg = pd.read_csv("./out/throughput_vector.csv")
+    ts_irg, _ = load_vector("./out/throughput_vector.csv")
     window_size_time_units *= 5
-    # sw_avg_irg = pd.Series([df_irg[(df_irg["timestamp"] >= t - window_size_time_units) & (df_irg["timestamp"] < t)]["sample"].mean() for t in df_irg["timestamp"]])
-    sw_avg_irg = pd.Series([df_irg[(df_irg["timestamp"] >= t - window_size_time_units) & (df_irg["timestamp"] < t)]["sample"].count() for t in df_irg["timestamp"]])
-    sw_avg_irg /= window_size_time_units # pairs per us
+    # sw_avg_irg = pd.Series(moving_window_mean(df_irg["timestamp"], df_irg["sample"], window_size_time_units))
+    sw_avg_irg = moving_window_count(ts_irg, window_size_time_units)
+    sw_avg_irg = sw_avg_irg / window_size_time_units  # pairs per us
     sw_avg_irg *= 1e3  # pairs per ms
 
-    df_irg["timestamp"] /= 1e3
+    ts_irg = ts_irg / 1e3
 
-    ax2.plot(df_irg["timestamp"], sw_avg_irg, color="blue", label="E2E Throughput")
+    ax2.plot(*decimate(ts_irg, sw_avg_irg), color="blue", label="E2E Throughput")
     # ax2.set_ylabel("Inter-Request Gap (IRG) (ms)", color="blue")
     ax2.set_ylabel("Throughput (pairs/ms)", color="blue")
     # ax2.set_ylim(0, 4)
@@ -96,18 +106,18 @@ if __name__ == "__main__":
     # we add a third axis to plot the throughput, again as a moving average
     throughput_window_size_time_units = 1000
     ax3 = ax.twinx()
+    import pandas as pd
     df_throughput = pd.read_csv("./out/throughput_vector.csv")
-    df_throughput["sw_index"] = df_throughput["timestamp"] // throughput_window_size_time_units
-    sw_avg_throughput = df_throughput.groupby("sw_index").count()
+    # group by the window index directly, without storing it as a column
+    sw_avg_throughput = df_throughput.groupby(df_throughput["timestamp"] // throughput_window_size_time_units).count()
     sw_avg_throughput["sample"] /= throughput_window_size_time_units  # pairs per ms
 
     ax3.plot(sw_avg_throughput.index, sw_avg_throughput["sample"], color="green", label="throughput")
     """
     """
-    df_fid = sw_avg
-    df_fid["fid"] = df_fid.apply(lambda row: compute_fid(row["sample"], 0.01), axis=1)
+    sw_avg_fid = compute_fid(sw_avg_lat, 0.01)
     ax2 = ax.twinx()
-    ax2.plot(df_fid["timestamp"], df_fid["fid"], color="green", label="Fidelity")
+    ax2.plot(sw_avg_ts, sw_avg_fid, color="green", label="Fidelity")
     ax2.set_ylabel("Fidelity")
     """
 
@@ -129,5 +139,6 @@ if __name__ == "__main__":
     # save the plot
     plt.savefig("./out/latency_dynamic.pdf")
 
-    plt.show()
+    if interactive:
+        plt.show()
 
@@ -2,19 +2,20 @@
 plot the congestion window from ./out3/congestion_window_vector.csv as a function of time (ms)
 there is only one flow
 """
-import math
-
-import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
 
+from qnum_congestion_ctrl_aqm_bidir.plot_utils import decimate, init_backend, load_vector, moving_window_mean, \
+    steady_state_mean
+
 def compute_fid(latency, gamma):
     """
-    Compute the flow id from the latency and the gamma parameter
+    Compute the flow id from the latency and the gamma parameter, element-wise if latency is an array
     """
-    return 0.5 + 0.5*math.exp(-2*gamma*latency)
+    return 0.5 + 0.5*np.exp(-2*gamma*np.asarray(latency))
 
 if __name__ == "__main__":
+    interactive = init_backend()
 
     fig, axs = plt.subplots(2, sharex=True)
     ax = axs[0]
@@ -34,56 +35,46 @@ if __name__ == "__main__":
     ax2.yaxis.set_label_coords(x=-0.06, y=0.5)
 
     # read also the file "latency_vector.csv" and plot a moving average of latency as a function of time in the same plot
-    df_lat = pd.read_csv("./out3/latency_vector.csv")
+    ts_lat, lat = load_vector("./out3/latency_vector.csv")
 
     # Compute the sliding window average
     window_size_time_units = 5000
 
-    # create a new column with the sliding window index
-    df_lat["sw_index"] = df_lat["timestamp"] // window_size_time_units
-
-    # compute the sliding window average
-    sw_avg = pd.Series(
-        [df_lat[(df_lat["timestamp"] >= t - window_size_time_units) & (df_lat["timestamp"] < t)]["sample"].mean() for t
-         in df_lat["timestamp"]])
+    # compute the sliding window average over [t - window, t)
+    sw_avg = moving_window_mean(ts_lat, lat, window_size_time_units)
 
     # divide the timestamp by 1e3 to have ms
-    df_lat["timestamp"] /= 1e3
+    ts_lat = ts_lat / 1e3
     sw_avg /= 1e3
 
     # ax2 = ax.twinx()
-    ax.plot(df_lat["timestamp"], sw_avg, color="red", label="latency")
+    ax.plot(*decimate(ts_lat, sw_avg), color="red", label="latency")
     # ax.set_ylabel("Latency (ms)")
 
     # still on ax2 print the average secret key rate for the second half of the simulation
-    ax.axhline(y=sw_avg[sw_avg.size // 2:].mean(), color='red', linestyle='--',
+    ax.axhline(y=steady_state_mean(sw_avg), color='red', linestyle='--',
                 label="AVG latency at steady state")
 
     # read also the file "latency_vector.csv" and plot a moving average of latency as a function of time in the same plot
-    df_fid = pd.read_csv("./out3/fidelity_vector.csv")
+    ts_fid, fid = load_vector("./out3/fidelity_vector.csv")
 
     # Compute the sliding window average
     window_size_time_units = 25000
 
-    # create a new column with the sliding window index
-    df_fid["sw_index"] = df_fid["timestamp"] // window_size_time_units
-
-    # compute the sliding window average
-    sw_avg = pd.Series(
-        [df_fid[(df_fid["timestamp"] >= t - window_size_time_units) & (df_fid["timestamp"] < t)]["sample"].mean() for t
-         in df_fid["timestamp"]])
+    # compute the sliding window average over [t - window, t)
+    sw_avg = moving_window_mean(ts_fid, fid, window_size_time_units)
 
     # divide the timestamp by 1e3 to have ms
-    df_fid["timestamp"] /= 1e3
+    ts_fid = ts_fid / 1e3
 
     ax2.set_ylim(0.4, 1)
 
     # ax2 = ax.twinx()
-    ax2.plot(df_fid["timestamp"], sw_avg, color="blue", label="E2E Fidelity")
+    ax2.plot(*decimate(ts_fid, sw_avg), color="blue", label="E2E Fidelity")
     # ax.set_ylabel("Latency (ms)")
 
     # still on ax2 print the average secret key rate for the second half of the simulation
-    ax2.axhline(y=sw_avg[sw_avg.size // 2:].mean(), color='blue', linestyle='--',
+    ax2.axhline(y=steady_state_mean(sw_avg), color='blue', linestyle='--',
                label="AVG E2E FID at steady state")
 
     # print the legends within the axis
@@ -103,5 +94,6 @@ if __name__ == "__main__":
     # save the plot
     plt.savefig("./out3/latency_fidelity.pdf")
 
-    plt.show()
+    if interactive:
+        plt.show()
 
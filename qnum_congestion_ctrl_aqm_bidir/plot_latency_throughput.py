@@ -2,19 +2,20 @@
 plot the congestion window from ./out2/congestion_window_vector.csv as a function of time (ms)
 there is only one flow
 """
-import math
-
-import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
 
+from qnum_congestion_ctrl_aqm_bidir.plot_utils import decimate, init_backend, load_vector, moving_window_count, \
+    moving_window_mean, steady_state_mean
+
 def compute_fid(latency, gamma):
     """
-    Compute the flow id from the latency and the gamma parameter
+    Compute the flow id from the latency and the gamma parameter, element-wise if latency is an array
     """
-    return 0.5 + 0.5*math.exp(-2*gamma*latency)
+    return 0.5 + 0.5*np.exp(-2*gamma*np.asarray(latency))
 
 if __name__ == "__main__":
+    interactive = init_backend()
 
     fig, axs = plt.subplots(2, sharex=True)
     ax = axs[0]
@@ -34,29 +35,24 @@ if __name__ == "__main__":
     ax2.yaxis.set_label_coords(x=-0.06, y=0.5)
 
     # read also the file "latency_vector.csv" and plot a moving average of latency as a function of time in the same plot
-    df_lat = pd.read_csv("./out2/latency_vector.csv")
+    ts_lat, lat = load_vector("./out2/latency_vector.csv")
 
     # Compute the sliding window average
     window_size_time_units = 5000
 
-    # create a new column with the sliding window index
-    df_lat["sw_index"] = df_lat["timestamp"] // window_size_time_units
-
     # compute the sliding window average
-    sw_avg = pd.Series(
-        [df_lat[(df_lat["timestamp"] >= t - window_size_time_units) & (df_lat["timestamp"] < t)]["sample"].mean() for t
-         in df_lat["timestamp"]])
+    sw_avg = moving_window_mean(ts_lat, lat, window_size_time_units)
 
     # divide the timestamp by 1e3 to have ms
-    df_lat["timestamp"] /= 1e3
+    ts_lat = ts_lat / 1e3
     sw_avg /= 1e3
 
     # ax2 = ax.twinx()
-    ax.plot(df_lat["timestamp"], sw_avg, color="red", label="latency")
+    ax.plot(*decimate(ts_lat, sw_avg), color="red", label="latency")
     # ax.set_ylabel("Latency (ms)")
 
     # still on ax2 print the average secret key rate for the second half of the simulation
-    ax.axhline(y=sw_avg[sw_avg.size // 2:].mean(), color='red', linestyle='--',
+    ax.axhline(y=steady_state_mean(sw_avg), color='red', linestyle='--',
                 label="AVG latency at steady state")
 
     """cur_flows = 4
@@ -84,40 +80,40 @@ if __name__ == "__main__":
 
 
     # read the IRG file and plot the Inter-Request Gap (IRG) on the same plot but on a different axis
-    df_irg = pd.read_csv("./out2/throughput_vector.csv")
+    ts_irg, _ = load_vector("./out2/throughput_vector.csv")
     window_size_time_units *= 5
-    # sw_avg_irg = pd.Series([df_irg[(df_irg["timestamp"] >= t - window_size_time_units) & (df_irg["timestamp"] < t)]["sample"].mean() for t in df_irg["timestamp"]])
-    sw_avg_irg = pd.Series([df_irg[(df_irg["timestamp"] >= t - window_size_time_units) & (df_irg["timestamp"] < t)]["sample"].count() for t in df_irg["timestamp"]])
-    sw_avg_irg /= window_size_time_units # pairs per us
+    # sw_avg_irg = pd.Series(moving_window_mean(df_irg["timestamp"], df_irg["sample"], window_size_time_units))
+    sw_avg_irg = moving_window_count(ts_irg, window_size_time_units)
+    sw_avg_irg = sw_avg_irg / window_size_time_units  # pairs per us
     sw_avg_irg *= 1e3  # pairs per ms
 
-    df_irg["timestamp"] /= 1e3
+    ts_irg = ts_irg / 1e3
 
-    ax2.plot(df_irg["timestamp"], sw_avg_irg, color="blue", label="E2E Throughput")
+    ax2.plot(*decimate(ts_irg, sw_avg_irg), color="blue", label="E2E Throughput")
     # ax2.set_ylabel("Inter-Request Gap (IRG) (ms)", color="blue")
     ax2.set_ylabel("Throughput (pairs/ms)", color="blue")
     # ax2.set_ylim(0, 4)
 
     # still on ax2 print the average secret key rate for the second half of the simulation
-    ax2.axhline(y=sw_avg_irg[sw_avg_irg.size // 2:].mean(), color='blue', linestyle='--',
+    ax2.axhline(y=steady_state_mean(sw_avg_irg), color='blue', linestyle='--',
                 label="AVG E2E SKR at steady state")
 
     """
     # we add a third axis to plot the throughput, again as a moving average
     throughput_window_size_time_units = 1000
     ax3 = ax.twinx()
+    import pandas as pd
     df_throughput = pd.read_csv("./out2/throughput_vector.csv")
-    df_throughput["sw_index"] = df_throughput["timestamp"] // throughput_window_size_time_units
-    sw_avg_throughput = df_throughput.groupby("sw_index").count()
+    # group by the window index directly, without storing it as a column
+    sw_avg_throughput = df_throughput.groupby(df_throughput["timestamp"] // throughput_window_size_time_units).count()
     sw_avg_throughput["sample"] /= throughput_window_size_time_units  # pairs per ms
 
     ax3.plot(sw_avg_throughput.index, sw_avg_throughput["sample"], color="green", label="throughput")
     """
     """
-    df_fid = sw_avg
-    df_fid["fid"] = df_fid.apply(lambda row: compute_fid(row["sample"], 0.01), axis=1)
+    sw_avg_fid = compute_fid(sw_avg, 0.01)
     ax2 = ax.twinx()
-    ax2.plot(df_fid["timestamp"], df_fid["fid"], color="green", label="Fidelity")
+    ax2.plot(ts_lat, sw_avg_fid, color="green", label="Fidelity")
     ax2.set_ylabel("Fidelity")
     """
 
@@ -139,5 +135,6 @@ if __name__ == "__main__":
     # save the plot
     plt.savefig("./out2/latency_dynamic.pdf")
 
-    plt.show()
+    if interactive:
+        plt.show()
 
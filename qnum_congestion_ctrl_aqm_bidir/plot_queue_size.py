@@ -2,12 +2,12 @@
 Read the file "queue_size_vector.csv" and plot the queue size as a function of time
 """
 
-import pandas as pd
 import matplotlib.pyplot as plt
 
-if __name__ == "__main__":
-    df = pd.read_csv("./out2/queue_size_vector.csv")
+from qnum_congestion_ctrl_aqm_bidir.plot_utils import decimate, init_backend, stream_moving_window_mean
 
+if __name__ == "__main__":
+    interactive = init_backend()
     fig, axs = plt.subplots(2, sharex=True)
     ax = axs[0]
     ax2 = axs[1]
@@ -19,15 +19,15 @@ if __name__ == "__main__":
     # every point in the plot is the average of all samples in the window
     # we can't use directly group by because the same sample may be in multiple adjacent windows
     # so, for every row in df, we compute the average of all samples in the window
-    # we use a list comprehension to do that
-    sw_avg = pd.Series([df[(df["timestamp"] >= t - window_size_time_units) & (df["timestamp"] < t)]["sample"].mean() for t in df["timestamp"]])
+    # we use a running sum over the sorted timestamps to do that, parsing the CSV chunk by chunk
+    ts, sw_avg = stream_moving_window_mean("./out2/queue_size_vector.csv", window_size_time_units)
 
-    df["timestamp"] = df["timestamp"] / 1e3  # convert to ms
+    ts = ts / 1e3  # convert to ms
 
     # multiply the sample column by 0.04
     # sw_avg *= 0.04
 
-    ax.plot(df["timestamp"], sw_avg, label="queue size", color="purple")
+    ax.plot(*decimate(ts, sw_avg), label="queue size", color="purple")
 
     ax.set_ylabel("Queue Size (# requests)", color="purple")
 
@@ -58,16 +58,15 @@ if __name__ == "__main__":
             cur_flows += 6"""
 
     # read the IRG file and plot the Inter-Request Gap (IRG) on the same plot but on a different axis
-    df_irg = pd.read_csv("./out2/IRG_vector.csv")
     window_size_time_units = 50000
-    sw_avg_irg = pd.Series([df_irg[(df_irg["timestamp"] >= t - window_size_time_units) & (df_irg["timestamp"] < t)]["sample"].mean() for t in df_irg["timestamp"]])
+    ts_irg, sw_avg_irg = stream_moving_window_mean("./out2/IRG_vector.csv", window_size_time_units)
 
-    df_irg["timestamp"] /= 1e3
+    ts_irg = ts_irg / 1e3
 
     # set y axis in ms
     sw_avg_irg /= 1e3
 
-    ax2.plot(df_irg["timestamp"], sw_avg_irg, color="green", label="IRG (flow 0)")
+    ax2.plot(*decimate(ts_irg, sw_avg_irg), color="green", label="IRG (flow 0)")
     # ax2.set_ylabel("Inter-Request Gap (IRG) (ms)", color="blue")
     ax2.set_ylabel("Inter-Request Gap (ms)", color="green")
 
@@ -84,7 +83,8 @@ if __name__ == "__main__":
 
     plt.tight_layout()
 
-    plt.show()
+    if interactive:
+        plt.show()
 
     # Save the figure
     fig.savefig("./out2/queue_size.pdf")
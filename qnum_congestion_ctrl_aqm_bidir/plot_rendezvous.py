@@ -6,7 +6,10 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
 
+from qnum_congestion_ctrl_aqm_bidir.plot_utils import init_backend
+
 if __name__ == "__main__":
+    interactive = init_backend()
     fig, ax = plt.subplots()
     ax.set_title("Rendezvous Analysis")
     ax.set_xlabel("Rendezvous Node")
@@ -15,20 +18,17 @@ if __name__ == "__main__":
     # plot the histogram with a column for every value in df["sample"]
     # the height of the column is the number of occurrences of that value in df["sample"]
 
-    # get the distinct values of the rendezvous node index
-    distinct_values = df["sample"].unique()
-    # sort the values
-    distinct_values.sort()
-    # compute the histogram
-    hist = [df[df["sample"] == val].shape[0] for val in distinct_values]
+    # get the sorted distinct values of the rendezvous node index and compute the histogram in the same pass
+    distinct_values, hist = np.unique(df["sample"].to_numpy(), return_counts=True)
 
     # normalize the histogram
-    hist = np.array(hist) / np.sum(hist)
+    hist = hist / hist.sum()
 
     # plot the histogram
     ax.bar(distinct_values, hist)
 
-    plt.show()
+    if interactive:
+        plt.show()
 
     # save the figure as pdf
     fig.savefig("./out2/rendezvous_node_bars.pdf")
@@ -0,0 +1,358 @@
+"""
+Helpers shared by the plot scripts.
+"""
+import itertools
+import os
+import sys
+
+import matplotlib
+import numpy as np
+import pandas as pd
+from pandas.api.indexers import BaseIndexer
+
+try:
+    from numba import njit, types
+    _HAVE_NUMBA = True
+    # contiguous float64 vectors, writable or read-only (e.g. parsed by pyarrow or loaded from the npz cache)
+    _VECTOR_TYPES = (types.Array(types.float64, 1, "C"), types.Array(types.float64, 1, "C", readonly=True))
+    _WINDOW_KERNEL_SIGNATURES = [_VECTOR_TYPES[0](ts, samples, types.float64)
+                                 for ts, samples in itertools.product(_VECTOR_TYPES, repeat=2)]
+except ImportError:  # numba is optional, fall back to plain Python
+    _HAVE_NUMBA = False
+    _WINDOW_KERNEL_SIGNATURES = []
+
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+
+def init_backend(argv=None):
+    """
+    Pick the matplotlib backend of a plot script from its command line, before any figure is created. By default the
+    figures are only saved, so the non-GUI Agg backend is used and no GUI toolkit or event loop is started. Pass
+    ``--interactive`` to keep the default backend and show the figures.
+
+    Parameters
+    ----------
+    argv : list of str, optional
+        The command line arguments, ``sys.argv[1:]`` by default
+
+    Returns
+    -------
+    bool
+        Whether the figures should be shown
+    """
+    interactive = "--interactive" in (sys.argv[1:] if argv is None else argv)
+    if not interactive:
+        matplotlib.use("Agg")
+    return interactive
+
+
+READ_KW = dict(engine="pyarrow", usecols=["timestamp", "sample"], dtype={"timestamp": "float64", "sample": "float64"})
+# multithreaded pyarrow parser, only the two columns we need and with their types given upfront
+READ_KW_FALLBACK = dict(engine="c", usecols=["timestamp", "sample"], float_precision="round_trip",
+                        dtype={"timestamp": "float64", "sample": "float64"})
+# pandas C parser, used when pyarrow is not installed and to parse in chunks. It rounds floats like pyarrow does.
+
+
+def load_vector(path):
+    """
+    Load the timestamp and sample columns of a vector CSV written by the simulator as two float64 arrays, without
+    keeping the DataFrame (and its index) around.
+
+    The parsed columns are cached in a ``<path>.npz`` sidecar next to the CSV, so later runs (e.g. while tweaking a
+    plot) read the binary arrays instead of parsing the CSV again. The cache is rebuilt when the CSV is newer.
+
+    Parameters
+    ----------
+    path : str
+        The path of the vector CSV
+
+    Returns
+    -------
+    tuple of numpy.ndarray
+        The timestamps and the samples. They may be read-only views on the parsed columns, do not scale them in place
+    """
+    cache_path = path + ".npz"
+    try:
+        if os.path.getmtime(cache_path) >= os.path.getmtime(path):
+            with np.load(cache_path) as cached:
+                return cached["timestamp"], cached["sample"]
+    except (OSError, KeyError, ValueError):
+        pass  # no usable cache, parse the CSV
+
+    try:
+        df = pd.read_csv(path, **READ_KW)
+    except ImportError:
+        df = pd.read_csv(path, **READ_KW_FALLBACK)
+    timestamps, samples = df["timestamp"].to_numpy(), df["sample"].to_numpy()
+
+    try:
+        np.savez(cache_path, timestamp=timestamps, sample=samples)
+    except OSError:
+        pass  # e.g. read-only output directory, just parse again next time
+    return timestamps, samples
+
+
+MAX_PLOT_POINTS = 5000
+# number of points above which a per-sample curve is decimated before being plotted
+
+
+def decimate(*arrays, max_points=MAX_PLOT_POINTS):
+    """
+    Keep one point every ``len // max_points`` of the given (equally long) arrays, so that a per-sample curve is not
+    drawn with millions of vertices. The moving averages we plot are smooth, so this is lossless at plot resolution.
+    Statistics (e.g. the steady state means) must still be computed on the full arrays.
+
+    Parameters
+    ----------
+    *arrays : array_like
+        The arrays to decimate, e.g. the timestamps and the samples of a curve
+    max_points : int, optional
+        The number of points below which the arrays are left as they are
+
+    Returns
+    -------
+    tuple
+        The decimated arrays, in the same order
+    """
+    step = max(1, len(arrays[0]) // max_points)
+    return tuple(array[::step] for array in arrays)
+
+
+def steady_state_mean(values):
+    """
+    Mean of the second half of a per-sample curve, i.e. of the simulation at steady state, ignoring NaN values (e.g.
+    empty windows) as pandas' mean does
+    """
+    values = np.asarray(values, dtype=np.float64)
+    return float(np.nanmean(values[len(values) // 2:]))
+
+
+def binary_entropy(x):
+    """
+    Binary entropy function h(x), element-wise. h(0) = h(1) = 0: the logarithms are only evaluated where their
+    argument is positive, so the endpoints give 0 instead of NaN (0 * -inf) and no floating point warnings are raised
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = 1 - x
+    log_x = np.log2(x, out=np.zeros_like(x), where=x > 0)
+    log_y = np.log2(y, out=np.zeros_like(y), where=y > 0)
+    return -x * log_x - y * log_y
+
+
+@njit(_WINDOW_KERNEL_SIGNATURES, cache=True, boundscheck=False)
+def _moving_window_mean(timestamps, samples, window):
+    # compiled for contiguous float64 vectors when this module is imported (and cached on disk), so the first call
+    # pays no JIT. No fastmath: it would let the compiler drop the NaN checks
+    n = timestamps.shape[0]
+    out = np.empty(n)
+    left = 0
+    right = 0
+    running_sum = 0.
+    count = 0
+    # the count stays an integer and is only divided once per output, when the window mean is written
+    for i in range(n):
+        t = timestamps[i]
+        t_start = t - window
+        # the window of sample i is [t - window, t): add what entered on the right, drop what left on the left
+        while right < n and timestamps[right] < t:
+            if not np.isnan(samples[right]):
+                running_sum += samples[right]
+                count += 1
+            right += 1
+        while left < right and timestamps[left] < t_start:
+            if not np.isnan(samples[left]):
+                running_sum -= samples[left]
+                count -= 1
+            left += 1
+        out[i] = running_sum / count if count > 0 else np.nan
+    return out
+
+
+class _TimeWindowIndexer(BaseIndexer):
+    """
+    Rolling window indexer with precomputed window bounds: ``start`` and ``end`` (exclusive) positions of each window
+    """
+
+    def get_window_bounds(self, num_values=0, min_periods=None, center=None, closed=None, step=None):
+        return self.start, self.end
+
+
+def _rolling_moving_window_mean(timestamps, samples, window):
+    """
+    :func:`moving_window_mean` with pandas' variable window rolling mean, on the exact [t - window, t) bounds found
+    with a binary search (a time based rolling window would round the timestamps to nanoseconds). The rolling kernel
+    compensates its running sum, so it stays accurate on long vectors.
+    """
+    order = np.argsort(timestamps, kind="stable")  # no-op on the time ordered vectors written by the simulator
+    ts_sorted = timestamps[order]
+    indexer = _TimeWindowIndexer(start=np.searchsorted(ts_sorted, ts_sorted - window, side="left").astype(np.int64),
+                                 end=np.searchsorted(ts_sorted, ts_sorted, side="left").astype(np.int64))
+    out = np.empty(len(timestamps))
+    out[order] = pd.Series(samples[order]).rolling(indexer, min_periods=1).mean().to_numpy()
+    return out
+
+
+def moving_window_mean(timestamps, samples, window):
+    """
+    Average of the samples in the time window [t - window, t) of every timestamp t, in a single pass with a running
+    sum (one add and one drop per sample) instead of re-averaging the whole window at each step. Without numba, the
+    same pass is done by pandas' rolling mean instead, to keep the loop out of Python. NaN samples are ignored and
+    empty windows give NaN, as pandas' mean does.
+
+    Parameters
+    ----------
+    timestamps : array_like
+        The sample timestamps, in non-decreasing order (as written by the simulator)
+    samples : array_like
+        The sample values
+    window : float
+        The window width, in the same unit as the timestamps
+
+    Returns
+    -------
+    numpy.ndarray
+        The moving average at each timestamp
+    """
+    timestamps = np.ascontiguousarray(timestamps, dtype=np.float64)
+    samples = np.ascontiguousarray(samples, dtype=np.float64)
+    if not _HAVE_NUMBA:
+        return _rolling_moving_window_mean(timestamps, samples, float(window))
+    return _moving_window_mean(timestamps, samples, float(window))
+
+
+STREAM_CHUNK_ROWS = 1_000_000  # rows parsed per chunk by stream_moving_window_mean
+
+
+def stream_moving_window_mean(path, window, chunksize=STREAM_CHUNK_ROWS):
+    """
+    :func:`moving_window_mean` of a vector CSV, parsed chunk by chunk so that the whole vector is never held in
+    memory. The windows only look back in time, so each chunk is averaged together with the samples of the previous
+    ones that are less than a window older than their last timestamp, which gives the same result as averaging the
+    whole vector at once.
+
+    Parameters
+    ----------
+    path : str
+        The path of the vector CSV, with timestamps in non-decreasing order (as written by the simulator)
+    window : float
+        The window width, in the same unit as the timestamps
+    chunksize : int, optional
+        The number of rows parsed at a time
+
+    Returns
+    -------
+    tuple of numpy.ndarray
+        The timestamps and the moving average at each of them
+    """
+    ts_parts, avg_parts = [], []
+    carry_ts = np.empty(0)
+    carry_samples = np.empty(0)
+    for chunk in pd.read_csv(path, chunksize=chunksize, **READ_KW_FALLBACK):
+        if len(chunk) == 0:
+            continue
+        ts = np.concatenate((carry_ts, chunk["timestamp"].to_numpy()))
+        samples = np.concatenate((carry_samples, chunk["sample"].to_numpy()))
+        ts_parts.append(ts[len(carry_ts):])
+        avg_parts.append(moving_window_mean(ts, samples, window)[len(carry_ts):])
+        # keep the samples that may still fall in the window of a later one
+        start = np.searchsorted(ts, ts[-1] - window, side="left")
+        carry_ts, carry_samples = ts[start:], samples[start:]
+    if not ts_parts:
+        return np.empty(0), np.empty(0)
+    return np.concatenate(ts_parts), np.concatenate(avg_parts)
+
+
+def _window_bounds(timestamps, window):
+    """
+    The time order of the timestamps and, for each timestamp t, the positions in that order where the window
+    [t - window, t) starts and ends, found with a binary search.
+    """
+    order = np.argsort(timestamps, kind="stable")  # no-op on the time ordered vectors written by the simulator
+    ts_sorted = timestamps[order]
+    return (order, np.searchsorted(ts_sorted, timestamps - window, side="left"),
+            np.searchsorted(ts_sorted, timestamps, side="left"))
+
+
+def moving_window_count(timestamps, window):
+    """
+    Number of samples in the time window [t - window, t) of every timestamp t, as the distance between two binary
+    search positions on the sorted timestamps.
+
+    Parameters
+    ----------
+    timestamps : array_like
+        The sample timestamps
+    window : float
+        The window width, in the same unit as the timestamps
+
+    Returns
+    -------
+    numpy.ndarray
+        The number of samples in the window of each timestamp
+    """
+    _, lo, hi = _window_bounds(np.asarray(timestamps, dtype=np.float64), window)
+    return hi - lo
+
+
+def moving_window_sum(timestamps, samples, window):
+    """
+    Sum of the samples in the time window [t - window, t) of every timestamp t, as the difference of the running
+    sums at the two ends of the window. NaN samples are skipped, as pandas' sum does.
+
+    Parameters
+    ----------
+    timestamps : array_like
+        The sample timestamps
+    samples : array_like
+        The sample values
+    window : float
+        The window width, in the same unit as the timestamps
+
+    Returns
+    -------
+    numpy.ndarray
+        The sum of the samples in the window of each timestamp
+    """
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    samples = np.asarray(samples, dtype=np.float64)
+    order, lo, hi = _window_bounds(timestamps, window)
+    csum = np.concatenate(([0.], np.cumsum(np.nan_to_num(samples[order], nan=0.))))
+    return csum[hi] - csum[lo]
+
+
+def section_means(timestamps, samples, width):
+    """
+    Average timestamps and samples over consecutive, non-overlapping time sections of the given width, like grouping
+    by ``timestamps // width`` and taking the mean (empty sections are skipped, NaN samples are ignored). Each
+    section is reduced at once with ``np.add.reduceat``.
+
+    Parameters
+    ----------
+    timestamps : array_like
+        The sample timestamps
+    samples : array_like
+        The sample values
+    width : float
+        The section width, in the same unit as the timestamps
+
+    Returns
+    -------
+    tuple of numpy.ndarray
+        The mean timestamp and the mean sample of every non-empty section
+    """
+    ts = np.asarray(timestamps, dtype=np.float64)
+    samples = np.asarray(samples, dtype=np.float64)
+    if len(ts) == 0:
+        return ts, samples
+    bucket = ts // width
+    order = np.argsort(bucket, kind="stable")  # no-op on the time ordered vectors written by the simulator
+    ts, samples, bucket = ts[order], samples[order], bucket[order]
+    # each section is a contiguous run of equal bucket indices, reduce every run at once
+    edges = np.flatnonzero(np.diff(bucket, prepend=bucket[0] - 1))
+    counts = np.diff(np.append(edges, len(ts)))
+    valid = ~np.isnan(samples)
+    sample_means = np.add.reduceat(np.where(valid, samples, 0.), edges) / np.add.reduceat(valid.astype(np.int64), edges)
+    return np.add.reduceat(ts, edges) / counts, sample_means
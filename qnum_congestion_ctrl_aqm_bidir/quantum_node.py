@@ -1,3 +1,7 @@
+import collections
+import itertools
+import logging
+
 from quantum_bell_api.decoherence import depolarize_rate
 from quantum_bell_api.swapping import swap
 from quantum_bell_api.utility import epr_pair, get_werner_state
@@ -8,7 +12,7 @@ from qnum_congestion_ctrl_aqm_bidir.congestion_controller import WindowCongestio
     RateCongestionController
 from qnum_congestion_ctrl_aqm_bidir.queues import RequestQueue, LLEManager
 from qnum_congestion_ctrl_aqm_bidir.request_generator import RequestGenerator
-from qnum_congestion_ctrl_aqm_bidir.utility import sanitize_flow_descriptors
+from qnum_congestion_ctrl_aqm_bidir.utility import get_flow_descriptors
 
 
 class QuantumNode(SimpleModule):
@@ -74,16 +78,22 @@ class QuantumNode(SimpleModule):
         # CONGESTION CONTROL VARIABLES #
         ################################
         self.congestion_controller = RateCongestionController()
+        self._is_rate_cc = isinstance(self.congestion_controller, RateCongestionController)
+        # whether the congestion controller is rate based, set again whenever the congestion controller is replaced
+
+        self.cur_req_ids = {}  # dictionary of request id counters (itertools.count), one for each flow, indexed by
+        # flow_id, used to keep track of which id assign to the next generated request for each flow
 
-        self.cur_req_ids = {}  # dictionary of current request ids, one for each flow, indexed by flow_id, used to
-        # keep track of which id assign to the next generated request for each flow
+        self._end_flow_ids = {}
+        # flow_ids of the flows of which this node is the source or the destination, used as an insertion ordered set
+        # (values are None) so that the per-flow events are scheduled in the same order as the flows
 
         self.tokens = {}  # dictionary of tokens, one for each flow, indexed by flow_id, used to keep track of the
         """number of tokens available for each flow. The tokens are used to limit the number of requests
         in the network"""
 
         self.request_admittance_queues = {}
-        """dictionary of request admittance queues, one for each flow, indexed by
+        """dictionary of request admittance queues (bounded deques), one for each flow, indexed by
         flow_id, used to keep track of the requests that are waiting to be admitted in the network"""
 
         self.admittance_queues_max_size = 1000
@@ -125,18 +135,41 @@ class QuantumNode(SimpleModule):
         ################################
         self.new_request_trigger_msgs = {}
         self.increase_request_rate_trigger_msgs = {}
+        self.new_token_msgs = {}
         ################################
         # END OF NEW REQUEST GENERATION #
         ################################
 
+        self._dispatch = {
+            # self messages
+            self.INITIALIZE_REQUESTS_MSG_HEADER: self._on_initialize_requests,
+            self.NEW_FLOW_TRIGGER_MSG_HEADER: self._on_new_flow_trigger,
+            self.NEW_REQUEST_TRIGGER_MSG_HEADER: self._on_new_request_trigger,
+            self.FLOW_KNOB_INCREMENT_MSG_HEADER: self._on_flow_knob_increment,
+            self.AQM_UPDATE_TRIGGER_MSG_HEADER: self._on_aqm_update,
+            self.NEW_TOKEN_MSG_HEADER: self._on_new_token,
+            self.TIMEOUT_TRIGGER_MSG_HEADER: self._on_timeout_trigger,
+            # packets addressed to this node
+            messages.FlowsInformationPacket.HEADER: self._on_flows_information,
+            messages.FlowDeletionPacket.HEADER: self._on_flow_deletion,
+            messages.EntanglementRequestPacket.HEADER: self._handle_entanglement_request,
+            messages.EntanglementGenPacket.HEADER: self._handle_new_lle,
+            messages.EntanglementGenAcknowledgement.HEADER: self._handle_req_ack,
+        }
+        # handlers of the messages received by this node, indexed by header. They all take (message, port_name)
+
+        self._routed_headers = frozenset((messages.FlowsInformationPacket.HEADER, messages.FlowDeletionPacket.HEADER,
+                                          messages.EntanglementRequestPacket.HEADER,
+                                          messages.EntanglementGenAcknowledgement.HEADER))
+        # headers of the routable packets, forwarded on the other port when this node is not their destination
+
     def initialize(self, step=0):
         if step == 0:
             # usually you can retrieve parameters by looking at self.parent attributes (parent is the compound module
             # containing this module)
 
             # access global parameters and get the flows information
-            flow_descriptors = self.sim_context.global_params["flow_descriptors"]
-            flow_descriptors = sanitize_flow_descriptors(flow_descriptors)
+            flow_descriptors = get_flow_descriptors(self.sim_context.global_params)
             # dict of flow descriptors, indexed by flow_id, each one containing the following fields (for now):
             # - flow_id
             # - source
@@ -180,148 +213,132 @@ class QuantumNode(SimpleModule):
         """
         Get the success probability for the request to be forwarded on the given port
         """
-        # get this node's position in the path
-        path = self.flows_info[request.flow_id]["path"]
-        # Remove elements at even indices
-        path_no_link_controllers = [path[i] for i in range(len(path)) if i % 2 == 0]
-        idx = path_no_link_controllers.index(self.name)
-        if direction == "downstream":
-            # we are going downstream
-            return self.flows_info[request.flow_id]["success_probs"][idx - 1]
-        elif direction == "upstream":
-            # we are going upstream
-            return self.flows_info[request.flow_id]["success_probs"][idx]
-        else:
+        # the success probabilities of the links on both sides are resolved once per flow, in
+        # _handle_flows_information
+        success_prob = self.flows_info[request.flow_id]["success_prob"]
+        if direction not in success_prob:
             raise ValueError(f"Unknown direction: {direction}")
+        return success_prob[direction]
 
 
     def handle_message(self, message, port_name):
+        meta = message.meta
+        header = meta.get("header")
 
-        if isinstance(message, messages.FlowsInformationPacket) and message.destination == self.name:
-            self._handle_flows_information(message)
-            return
-
-        if isinstance(message, messages.FlowDeletionPacket) and message.destination == self.name:
-            self._handle_flow_deletion(message)
+        if header in self._routed_headers and meta["destination"] != self.name:
+            # if this is not the destination, forward the packet on the other port
+            self.send(message, "q1" if port_name == "q0" else "q0")
             return
 
-        if "header" in message.meta and message.meta["header"] == self.INITIALIZE_REQUESTS_MSG_HEADER:
-            # we generate the first requests for each flow for which we are the source or the destination
-            for flow_id in self.flows_info:
-                if self.name == self.flows_info[flow_id]["source"] or self.name == self.flows_info[flow_id]["destination"]:
-                    if not isinstance(self.congestion_controller, RateCongestionController):
-                        # create the first token
-                        self._handle_new_token(flow_id=flow_id)
-                    else:
-                        # schedule the first token generation
-                        self.schedule_message(Message([flow_id], header=self.NEW_TOKEN_MSG_HEADER),
-                                              delay=self.congestion_controller.get_inter_request_gap(flow_id=flow_id))
-                        # schedule the next increase in the flow rate
-                        self.schedule_message(self.increase_request_rate_trigger_msgs[flow_id],
-                                              delay=self.congestion_controller.estimated_rtt[flow_id])
-
-                        # schedule the first request generation
-                        self.schedule_message(self.new_request_trigger_msgs[flow_id],
-                                              delay=self.request_generators[flow_id].next_request_gap())
-
-            return
+        handler = self._dispatch.get(header)
+        if handler is None:
+            raise ValueError(f"Unknown message received: {message} at node {self.name}")
+        handler(message, port_name)
 
-        if "header" in message.meta and message.meta["header"] == self.NEW_FLOW_TRIGGER_MSG_HEADER:
-            """self._generate_new_flow()
-            self.schedule_message(self.new_flow_trigger_msg, delay=self.new_flow_trigger_period)"""
+    def _on_initialize_requests(self, message, port_name):
+        # we generate the first requests for each flow for which we are the source or the destination
+        for flow_id in self._end_flow_ids:
+            if not self._is_rate_cc:
+                # create the first token
+                self._handle_new_token(flow_id=flow_id)
+            else:
+                # schedule the first token generation
+                self.schedule_message(self.new_token_msgs[flow_id],
+                                      delay=self.congestion_controller.get_inter_request_gap(flow_id=flow_id))
+                # schedule the next increase in the flow rate
+                self.schedule_message(self.increase_request_rate_trigger_msgs[flow_id],
+                                      delay=self.congestion_controller.estimated_rtt[flow_id])
+
+                # schedule the first request generation
+                self.schedule_message(self.new_request_trigger_msgs[flow_id],
+                                      delay=self.request_generators[flow_id].next_request_gap())
+
+    def _on_new_flow_trigger(self, message, port_name):
+        """self._generate_new_flow()
+        self.schedule_message(self.new_flow_trigger_msg, delay=self.new_flow_trigger_period)"""
+        return
+
+    def _on_new_request_trigger(self, message, port_name):
+        flow_id = message.fields[0]
+        flow = self.flows_info.get(flow_id)
+        if flow is None:
+            # the flow has been deleted
+            del self.new_request_trigger_msgs[flow_id]
             return
 
-        if "header" in message.meta and message.meta["header"] == self.NEW_REQUEST_TRIGGER_MSG_HEADER:
-
-            if message.fields[0] not in self.flows_info:
-                # the flow has been deleted
-                del self.new_request_trigger_msgs[message.fields[0]]
-                return
-
-            request_pkt = self.generate_request(flow_id=message.fields[0])
+        request_pkt = self.generate_request(flow_id=flow_id)
+        tokens = self.tokens.get(flow_id, 0)
+        if tokens > 0:
+            # common case, a token is available: fire_request_with_token and fire_request inlined
+            self.tokens[flow_id] = tokens - 1
+            now = self.sim_context.time()
+            request_pkt.gen_time = now
+            self._handle_new_request(request_pkt)
+            self.congestion_controller.handle_new_request_in_flight(req_id=request_pkt.req_id, flow_id=flow_id,
+                                                                    current_time=now)
+        else:
             self.fire_request_with_token(request_pkt)
 
-            # check the increase_at parameter
-            if not self.rates_increased:
-                increase_at = self.sim_context.global_params["request_generation"]["increase_at"]
-                increase_by = self.sim_context.global_params["request_generation"]["increase_by"]
+        # check the increase_at parameter
+        if not self.rates_increased:
+            increase_at = self.sim_context.global_params["request_generation"]["increase_at"]
+            increase_by = self.sim_context.global_params["request_generation"]["increase_by"]
 
-                if increase_at <= self.sim_context.time():
-                    for flow_idx in self.request_generators:
-                        old_rate = self.request_generators[flow_idx].arrival_rate
+            if increase_at <= self.sim_context.time():
+                for flow_idx in self.request_generators:
+                    old_rate = self.request_generators[flow_idx].arrival_rate
 
-                        self.request_generators[flow_idx] = RequestGenerator(arrival_rate=old_rate + increase_by,
-                                                                            rng=self.sim_context.rng,
-                                                                            rng_index=flow_idx)
-                        self.rates_increased = True
+                    self.request_generators[flow_idx] = self._new_request_generator(old_rate + increase_by, flow_idx)
+                    self.rates_increased = True
 
-            delay = self.request_generators[message.fields[0]].next_request_gap()
+        delay = self.request_generators[flow_id].next_request_gap()
 
-            # check if the admittance queue is full
-            if message.fields[0] in self.request_admittance_queues and len(self.request_admittance_queues[message.fields[0]]) > 0:
-                # in this case we increase the delay to the next request generation
-                flow_arrival_rate = self.flows_info[message.fields[0]]["request_rate"]
-                flow_avg_inter_request_gap = self.sim_context.time_unit_factor / flow_arrival_rate
-                delay += 10 * flow_avg_inter_request_gap
+        # check if the admittance queue is full
+        if self.request_admittance_queues.get(flow_id):
+            # in this case we increase the delay to the next request generation
+            flow_arrival_rate = flow["request_rate"]
+            flow_avg_inter_request_gap = self.sim_context.time_unit_factor / flow_arrival_rate
+            delay += 10 * flow_avg_inter_request_gap
 
-            self.schedule_message(message, delay=delay)
-            return
+        self.schedule_message(message, delay=delay)
 
-        if "header" in message.meta and message.meta["header"] == self.FLOW_KNOB_INCREMENT_MSG_HEADER:
-            if not isinstance(self.congestion_controller, RateCongestionController):
-                raise ValueError("The global rate increase period is set but the congestion controller"
-                                 "is not a RateCongestionController")
+    def _on_flow_knob_increment(self, message, port_name):
+        if not self._is_rate_cc:
+            raise ValueError("The global rate increase period is set but the congestion controller"
+                             "is not a RateCongestionController")
 
-            if message.fields[0] not in self.flows_info:
-                # the flow has been deleted
-                del self.increase_request_rate_trigger_msgs[message.fields[0]]
-                return
-
-            flow_id = message.fields[0]
-            self.congestion_controller.increase_congestion_knob(flow_id=message.fields[0],
-                                                                current_time=self.sim_context.time())
-            # get estimated rtt
-            rtt = self.congestion_controller.estimated_rtt[flow_id]
-            # schedule the next increase for the estimated rtt
-
-            self.schedule_message(message, delay=rtt)
-            return
-
-        if port_name is None and message.meta["header"] == self.AQM_UPDATE_TRIGGER_MSG_HEADER:
-            direction = message.fields[0]
-            out_port = "q0" if direction == "downstream" else "q1"
-            current_q_len = self.req_queue.weighted_length(out_port=out_port)
-            self.aqm_controllers[direction].update(q=current_q_len)
-            self._schedule_aqm_update(direction)
+        if message.fields[0] not in self.flows_info:
+            # the flow has been deleted
+            del self.increase_request_rate_trigger_msgs[message.fields[0]]
             return
 
-        if port_name is None and message.meta["header"] == self.NEW_TOKEN_MSG_HEADER:
-            self._handle_new_token(flow_id=message.fields[0])
-            return
+        flow_id = message.fields[0]
+        self.congestion_controller.increase_congestion_knob(flow_id=message.fields[0],
+                                                            current_time=self.sim_context.time())
+        # get estimated rtt
+        rtt = self.congestion_controller.estimated_rtt[flow_id]
+        # schedule the next increase for the estimated rtt
 
-        if isinstance(message, messages.RoutablePacket) and message.destination != self.name:
-            # if this is not the destination, forward the packet on the other port
-            self.send(message, "q1" if port_name == "q0" else "q0")
-            return
+        self.schedule_message(message, delay=rtt)
 
-        if isinstance(message, messages.EntanglementRequestPacket):
-            self._handle_entanglement_request(message, port_name)
-            return
+    def _on_aqm_update(self, message, port_name):
+        direction = message.fields[0]
+        out_port = "q0" if direction == "downstream" else "q1"
+        current_q_len = self.req_queue.weighted_length(out_port=out_port)
+        self.aqm_controllers[direction].update(q=current_q_len)
+        self._schedule_aqm_update(direction)
 
-        if isinstance(message, messages.EntanglementGenPacket):
-            self._handle_new_lle(message, port_name)
-            return
+    def _on_new_token(self, message, port_name):
+        self._handle_new_token(flow_id=message.fields[0])
 
-        if isinstance(message, messages.EntanglementGenAcknowledgement):
-            self._handle_req_ack(message, port_name)
-            return
+    def _on_timeout_trigger(self, message, port_name):
+        self.collect_timeouts()
 
-        if "header" in message.meta and message.meta["header"] == self.TIMEOUT_TRIGGER_MSG_HEADER:
-            self.collect_timeouts()
-            return
+    def _on_flows_information(self, message, port_name):
+        self._handle_flows_information(message)
 
-        else:
-            raise ValueError(f"Unknown message received: {message} at node {self.name}")
+    def _on_flow_deletion(self, message, port_name):
+        self._handle_flow_deletion(message)
 
     def _handle_flows_information(self, message):
         """
@@ -339,57 +356,68 @@ class QuantumNode(SimpleModule):
             flow = relevant_flows[flow_id]
             next_port = {"downstream": "q0", "upstream": "q1"}
             arrival_rate = flow["request_rate"]
-            if self.name == flow["source"]:
+            src = flow["source"]
+            dst = flow["destination"]
+            path = flow["path"]
+            my_idx = path.index(self.name)
+            if self.name == src or self.name == dst:
+                self._end_flow_ids[flow_id] = None
+            if self.name == src:
                 self.congestion_controller.setup_congestion_control(flow, current_time=self.sim_context.time())
-                self.cur_req_ids[flow_id] = 0
+                self.cur_req_ids[flow_id] = itertools.count(0)
                 self.new_request_trigger_msgs[flow_id] = Message([flow_id],
                                                                  header=self.NEW_REQUEST_TRIGGER_MSG_HEADER)
                 self.increase_request_rate_trigger_msgs[flow_id] = Message([flow_id],
                                                                            header=self.FLOW_KNOB_INCREMENT_MSG_HEADER)
+                self.new_token_msgs[flow_id] = Message([flow_id], header=self.NEW_TOKEN_MSG_HEADER)
 
-                self.request_generators[flow_id] = RequestGenerator(arrival_rate=arrival_rate, rng=self.sim_context.rng,
-                                                                    rng_index=flow_id)
+                self.request_generators[flow_id] = self._new_request_generator(arrival_rate, flow_id)
 
                 # initialize the token counter and the request admittance queue
                 self.tokens[flow_id] = 0
-                self.request_admittance_queues[flow_id] = []
+                self.request_admittance_queues[flow_id] = collections.deque(maxlen=self.admittance_queues_max_size)
 
-            if self.name == flow["destination"]:
+            if self.name == dst:
                 self.congestion_controller.setup_congestion_control(flow, current_time=self.sim_context.time(),
                                                                     is_source=False)
-                self.cur_req_ids[flow_id] = 1000000
+                self.cur_req_ids[flow_id] = itertools.count(1000000)
                 self.new_request_trigger_msgs[flow_id] = Message([flow_id],
                                                                  header=self.NEW_REQUEST_TRIGGER_MSG_HEADER)
                 self.increase_request_rate_trigger_msgs[flow_id] = Message([flow_id],
                                                                            header=self.FLOW_KNOB_INCREMENT_MSG_HEADER)
+                self.new_token_msgs[flow_id] = Message([flow_id], header=self.NEW_TOKEN_MSG_HEADER)
                 # add a request generator for the flow
-                self.request_generators[flow_id] = RequestGenerator(arrival_rate=arrival_rate, rng=self.sim_context.rng,
-                                                                    rng_index=flow_id)
+                self.request_generators[flow_id] = self._new_request_generator(arrival_rate, flow_id)
 
                 # initialize the token counter and the request admittance queue
                 self.tokens[flow_id] = 0
-                self.request_admittance_queues[flow_id] = []
+                self.request_admittance_queues[flow_id] = collections.deque(maxlen=self.admittance_queues_max_size)
 
 
-            if self.name != flow["destination"]:
-                next_hop_up = flow["path"][flow["path"].index(self.name) + 2]
-            else:
-                next_hop_up = None
-            if self.name != flow["source"]:
-                next_hop_down = flow["path"][flow["path"].index(self.name) - 2]
-            else:
-                next_hop_down = None
             # next hop in the path, +2 because the path includes the link controllers
+            next_hop_up = path[my_idx + 2] if self.name != dst else None
+            next_hop_down = path[my_idx - 2] if self.name != src else None
+
+            # get this node's position in the path without the link controllers (which are at odd indices)
+            idx = my_idx // 2
+            success_probs = flow["success_probs"]
+            success_prob = {
+                # going downstream, we use the link on our left
+                "downstream": success_probs[idx - 1],
+                # going upstream, we use the link on our right (there is none at the destination)
+                "upstream": success_probs[idx] if idx < len(success_probs) else None
+            }
 
             flow_info[flow_id] = {
                 "next_port": next_port,
-                "source": flow["source"],
-                "destination": flow["destination"],
+                "source": src,
+                "destination": dst,
                 "next_hop_down": next_hop_down,
                 "next_hop_up": next_hop_up,
                 "success_probs": flow["success_probs"],
-                "path": flow["path"],
-                "request_rate": flow["request_rate"]
+                "success_prob": success_prob,
+                "path": path,
+                "request_rate": arrival_rate
             }
 
         was_init = False
@@ -399,8 +427,9 @@ class QuantumNode(SimpleModule):
         else:
             self.flows_info.update(flow_info)
 
-        sim_log.debug(f"{self.name} received flows information with {len(relevant_flows)} relevant flows.",
-                      time=self.sim_context.time())
+        if sim_log.logger.isEnabledFor(logging.DEBUG):
+            sim_log.debug(f"{self.name} received flows information with {len(relevant_flows)} relevant flows.",
+                          time=self.sim_context.time())
 
         # we generate the first requests for each flow for which we are the source or the destination
         # but we wait for a little time to let the other nodes initialize
@@ -409,13 +438,13 @@ class QuantumNode(SimpleModule):
                                   delay=10)
         else:
             for flow_id in flow_info:
-                if self.name == flow_info[flow_id]["source"] or self.name == flow_info[flow_id]["destination"]:
-                    if not isinstance(self.congestion_controller, RateCongestionController):
+                if flow_id in self._end_flow_ids:
+                    if not self._is_rate_cc:
                         # create the first token
                         self._handle_new_token(flow_id=flow_id)
                     else:
                         # schedule the first token generation
-                        self.schedule_message(Message([flow_id], header=self.NEW_TOKEN_MSG_HEADER),
+                        self.schedule_message(self.new_token_msgs[flow_id],
                                               delay=self.congestion_controller.get_inter_request_gap(flow_id=flow_id))
                         # schedule the next increase in the flow rate
                         self.schedule_message(self.increase_request_rate_trigger_msgs[flow_id],
@@ -425,6 +454,15 @@ class QuantumNode(SimpleModule):
                         self.schedule_message(self.new_request_trigger_msgs[flow_id],
                                               delay=self.request_generators[flow_id].next_request_gap())
 
+    def _new_request_generator(self, arrival_rate, flow_id):
+        """
+        Create the request generator of the given flow. The gaps are drawn in batches if the global parameter
+        request_generation.gap_batch_size is set, see :class:`RequestGenerator`
+        """
+        batch_size = self.sim_context.global_params["request_generation"].get("gap_batch_size", 0)
+        return RequestGenerator(arrival_rate=arrival_rate, rng=self.sim_context.rng, rng_index=flow_id,
+                                batch_size=batch_size)
+
     def _handle_new_token(self, flow_id):
         """
         Handle the generation of a new token for the given flow_id
@@ -437,7 +475,7 @@ class QuantumNode(SimpleModule):
         # check if there are requests in the admittance queue
         if flow_id in self.request_admittance_queues and len(self.request_admittance_queues[flow_id]) > 0:
             # pop the request from the queue
-            request = self.request_admittance_queues[flow_id].pop(0)
+            request = self.request_admittance_queues[flow_id].popleft()
             # fire the request
             self.fire_request(request)
         else:
@@ -456,11 +494,12 @@ class QuantumNode(SimpleModule):
         This method is called when a FlowDeletionPacket is received
         """
         flow_id = message.flow_id
-        if flow_id in self.flows_info:
+        flow = self.flows_info.get(flow_id)
+        if flow is not None:
 
             # if we are the source of the flow, we have to delete the flow from the congestion controller
             # and cancel the scheduled messages
-            if self.name == self.flows_info[flow_id]["source"] or self.name == self.flows_info[flow_id]["destination"]:
+            if self.name == flow["source"] or self.name == flow["destination"]:
                 self.congestion_controller.delete_flow(flow_id)
 
             # delete all requests in the queue for the flow and all the LLEs
@@ -469,9 +508,12 @@ class QuantumNode(SimpleModule):
 
             # delete the flow information
             del self.flows_info[flow_id]
+            self._end_flow_ids.pop(flow_id, None)
+            self.new_token_msgs.pop(flow_id, None)
             del self.tokens[flow_id]
             del self.request_generators[flow_id]
-            sim_log.debug(f"Flow {flow_id} deleted at node {self.name}", time=self.sim_context.time())
+            if sim_log.logger.isEnabledFor(logging.DEBUG):
+                sim_log.debug(f"Flow {flow_id} deleted at node {self.name}", time=self.sim_context.time())
         else:
             sim_log.error(f"Flow {flow_id} not found at node {self.name}", time=self.sim_context.time())
             raise ValueError(f"Flow {flow_id} not found at node {self.name}")
@@ -481,22 +523,22 @@ class QuantumNode(SimpleModule):
         Generate a request for the given flow_id
         """
         # generate a new request
-        req_id = self.cur_req_ids[flow_id]
-        self.cur_req_ids[flow_id] += 1
+        req_id = next(self.cur_req_ids[flow_id])
+        flow = self.flows_info[flow_id]
 
         # determine the direction and the next hop destination depending on whether we are the source or the destination
-        if self.name == self.flows_info[flow_id]["source"]:
+        if self.name == flow["source"]:
             direction = "upstream"
-            destination = self.flows_info[flow_id]["next_hop_up"]
+            destination = flow["next_hop_up"]
         else:
             direction = "downstream"
-            destination = self.flows_info[flow_id]["next_hop_down"]
+            destination = flow["next_hop_down"]
 
         request_pkt = messages.EntanglementRequestPacket(destination=destination, flow_id=flow_id, req_id=req_id,
                                                          lle_id=None, gen_time=self.sim_context.time())
 
         # set the success probabilities as a meta field
-        request_pkt.meta["success_probs"] = self.flows_info[flow_id]["success_probs"][:]
+        request_pkt.meta["success_probs"] = flow["success_probs"][:]
         request_pkt.meta["direction"] = direction
 
         return request_pkt
@@ -529,14 +571,16 @@ class QuantumNode(SimpleModule):
             self.fire_request(request_pkt)
         else:
             # put the request in the admittance queue
-            # if it is full, drop the request
-            if request_pkt.flow_id not in self.request_admittance_queues:
-                self.request_admittance_queues[request_pkt.flow_id] = []
-            if len(self.request_admittance_queues[request_pkt.flow_id]) < self.admittance_queues_max_size:
-                self.request_admittance_queues[request_pkt.flow_id].append(request_pkt)
-            else:
+            # if it is full, drop the request (a bounded deque would silently evict the oldest one instead)
+            queue = self.request_admittance_queues.get(request_pkt.flow_id)
+            if queue is None:
+                queue = collections.deque(maxlen=self.admittance_queues_max_size)
+                self.request_admittance_queues[request_pkt.flow_id] = queue
+            if len(queue) == queue.maxlen:
                 sim_log.warning(f"Admittance queue for flow {request_pkt.flow_id} is full. Request dropped.",
                                 time=self.sim_context.time())
+            else:
+                queue.append(request_pkt)
 
     def collect_timeouts(self):
         """
@@ -547,19 +591,16 @@ class QuantumNode(SimpleModule):
 
         if self.last_update_time + 20000 <= self.sim_context.time():
             self.last_update_time = self.sim_context.time()
+            if not sim_log.logger.isEnabledFor(logging.DEBUG):
+                # sim_log formats eagerly, the updates below would only be built to be dropped
+                return
             # log some simulation updates for the user
             sim_log.debug(f"Node {self.name} has currently {len(self.req_queue)} requests in queue and"
                           f"{len(self.lle_manager)} LLEs",
                           time=self.sim_context.time())
-            # for all flows of which we are the source, we log the current generation probability
-            for flow_id in self.flows_info:
-                if self.name == self.flows_info[flow_id]["source"] and isinstance(self.congestion_controller,
-                                                                                  RateCongestionController):
-                    p_gen = self.congestion_controller.get_inter_request_gap(flow_id=flow_id)
-                    sim_log.debug(f"Node {self.name} has an IRG = {p_gen} us for flow {flow_id}",
-                                  time=self.sim_context.time())
-                if self.name == self.flows_info[flow_id]["destination"] and isinstance(self.congestion_controller,
-                                                                                       RateCongestionController):
+            # for all flows of which we are the source or the destination, we log the current generation probability
+            if self._is_rate_cc:
+                for flow_id in self._end_flow_ids:
                     p_gen = self.congestion_controller.get_inter_request_gap(flow_id=flow_id)
                     sim_log.debug(f"Node {self.name} has an IRG = {p_gen} us for flow {flow_id}",
                                   time=self.sim_context.time())
@@ -632,8 +673,9 @@ class QuantumNode(SimpleModule):
                 else:
                     self.send(new_flow_info, port_name="q0")
 
-            sim_log.debug(f"Node {self.name} generated a new flow {new_flow['flow_id']}",
-                          time=self.sim_context.time())
+            if sim_log.logger.isEnabledFor(logging.DEBUG):
+                sim_log.debug(f"Node {self.name} generated a new flow {new_flow['flow_id']}",
+                              time=self.sim_context.time())
 
     def _handle_entanglement_request(self, message, port_name):
         """
@@ -641,8 +683,9 @@ class QuantumNode(SimpleModule):
         """
 
         flow_id = message.flow_id
+        flow = self.flows_info.get(flow_id)
 
-        assert flow_id in self.flows_info, f"Flow {flow_id} not found in the flows information"
+        assert flow is not None, f"Flow {flow_id} not found in the flows information"
         # assert port_name != self.flows_info[flow_id]["next_port"], "Received a request from the wrong port"
 
         """
@@ -680,8 +723,8 @@ class QuantumNode(SimpleModule):
                 message.mark_congested()
 
 
-        if ((direction == "upstream" and self.name == self.flows_info[flow_id]["destination"]) or
-                (direction == "downstream" and self.name == self.flows_info[flow_id]["source"])):
+        if ((direction == "upstream" and self.name == flow["destination"]) or
+                (direction == "downstream" and self.name == flow["source"])):
             # we are the destination, we are done :)
             # pop the lle the request refers to from the available lles and emit 1
             lle, lle_time = self.lle_manager.pop_from_req(request=message, raise_error=True)
@@ -695,7 +738,7 @@ class QuantumNode(SimpleModule):
             self._decohere_state(message, wait_time, get_werner_state(fidelity=1.))
 
             # generate and send the acknowledgement
-            destination = self.flows_info[flow_id]["source"] if direction == "upstream" else self.flows_info[flow_id]["destination"]
+            destination = flow["source"] if direction == "upstream" else flow["destination"]
             ack = messages.EntanglementGenAcknowledgement(req_id=message.req_id, flow_id=flow_id,
                                                           destination=destination,
                                                           congested=message.is_congested(),
@@ -775,10 +818,11 @@ class QuantumNode(SimpleModule):
             self.send(ack_b, port_name=other_port)
 
             # log a bunch of debug info about who is sending what to whom
-            sim_log.debug(
-                f"Request {message.req_id} swapped with request {other_request.req_id} for flow {flow_id}. Here is node {self.name}."
-                f" Request {message.req_id} sent to {destination_a} through port {port_name} and request {other_request.req_id} sent to {destination_b} through port {other_port}",
-                time=self.sim_context.time())
+            if sim_log.logger.isEnabledFor(logging.DEBUG):
+                sim_log.debug(
+                    f"Request {message.req_id} swapped with request {other_request.req_id} for flow {flow_id}. Here is node {self.name}."
+                    f" Request {message.req_id} sent to {destination_a} through port {port_name} and request {other_request.req_id} sent to {destination_b} through port {other_port}",
+                    time=self.sim_context.time())
 
             self.emit_metric("rendezvous_node", int(self.name[2:]))
 
@@ -787,8 +831,8 @@ class QuantumNode(SimpleModule):
 
         # we have to check whether we have a lle to swap with the request
         # if so, we swap, update the message information and forward the request to the next node
-        next_port = self.flows_info[flow_id]["next_port"][direction]
-        next_hop = self.flows_info[flow_id]["next_hop_down"] if direction == "downstream" else self.flows_info[flow_id]["next_hop_up"]
+        next_port = flow["next_port"][direction]
+        next_hop = flow["next_hop_down"] if direction == "downstream" else flow["next_hop_up"]
         if self.lle_manager.is_empty(port_name=next_port, flow_id=flow_id):
             # just append the request to the corresponding queue
             success_prob = self._get_success_prob(message, direction=message.meta["direction"])
@@ -836,10 +880,10 @@ class QuantumNode(SimpleModule):
 
     def _handle_new_request(self, message):
         flow_id = message.flow_id
+        flow = self.flows_info.get(flow_id)
 
         # if we are not the source we ignore the request
-        if (flow_id not in self.flows_info or
-                (self.name != self.flows_info[flow_id]["source"] and self.name != self.flows_info[flow_id]["destination"])):
+        if flow is None or (self.name != flow["source"] and self.name != flow["destination"]):
             raise ValueError(f"New request for which we are not the source: {message} at node {self.name}")
 
 
@@ -868,9 +912,8 @@ class QuantumNode(SimpleModule):
         # we are the source, we have to check whether we have a lle to associate with the request
         # if so, we associate the lle and send the request to the next node
         direction = message.meta["direction"]
-        next_port = self.flows_info[flow_id]["next_port"][direction]
-        next_hop = self.flows_info[flow_id]["next_hop_down"] if direction == "downstream" else self.flows_info[flow_id][
-            "next_hop_up"]
+        next_port = flow["next_port"][direction]
+        next_hop = flow["next_hop_down"] if direction == "downstream" else flow["next_hop_up"]
         if self.lle_manager.is_empty(port_name=next_port, flow_id=flow_id):
             # just append the request to the corresponding queue
 
@@ -909,7 +952,8 @@ class QuantumNode(SimpleModule):
         # if so, we swap, update the message information and forward the request to the next node
 
         # first of all we have to check whether the flow is still active
-        if flow_id not in self.flows_info:
+        flow = self.flows_info.get(flow_id)
+        if flow is None:
             # the flow has been deleted
             # do nothing
             return
@@ -943,12 +987,11 @@ class QuantumNode(SimpleModule):
         # there is at least a request for this flow on this port
         direction = request.meta["direction"]
         next_port = port_name
-        next_hop = self.flows_info[flow_id]["next_hop_down"] if direction == "downstream" else self.flows_info[flow_id][
-            "next_hop_up"]
+        next_hop = flow["next_hop_down"] if direction == "downstream" else flow["next_hop_up"]
 
         # Now we have to check whether we are the source of the flow
-        if ((direction == "upstream" and self.name == self.flows_info[flow_id]["source"]) or
-                (direction == "downstream" and self.name == self.flows_info[flow_id]["destination"])):
+        if ((direction == "upstream" and self.name == flow["source"]) or
+                (direction == "downstream" and self.name == flow["destination"])):
             # in this case we just have to associate the new lle to the request and send it to the next node
             request.update_request(lle_id=message.lle_id, wait_time=None,
                                    destination=next_hop)
@@ -1043,13 +1086,14 @@ class QuantumNode(SimpleModule):
 
             self.emit_metric("latency", self.sim_context.time() - message.gen_time)
 
-        if flow_id not in self.flows_info:
+        flow = self.flows_info.get(flow_id)
+        if flow is None:
             sim_log.warning(f"Received an acknowledgement for a flow not in the flows information: {message} at node {self.name}",
                             time=self.sim_context.time())
             return
 
         # first we check whether we are the source of the flow, otherwise we throw an error
-        if self.name != self.flows_info[flow_id]["source"] and self.name != self.flows_info[flow_id]["destination"]:
+        if self.name != flow["source"] and self.name != flow["destination"]:
             raise ValueError(f"Received an acknowledgement for a flow for which we are not"
                              f"the source or destination: {message} at node {self.name}")
 
@@ -1062,7 +1106,7 @@ class QuantumNode(SimpleModule):
         if flow_id == 0 and isinstance(self.congestion_controller, WindowCongestionController):
             self.emit_metric("congestion_window", self.congestion_controller.get_congestion_window(flow_id))
 
-        elif flow_id == 0 and isinstance(self.congestion_controller, RateCongestionController):
+        elif flow_id == 0 and self._is_rate_cc:
             self.emit_metric("IRG", self.congestion_controller.get_inter_request_gap(flow_id))
 
         # we generate new tokens for the flow
@@ -3,6 +3,11 @@ In this module we implement the RequestQueue class, which is a simple wrapper ar
 store the requests that are waiting to be processed by QuantumNodes.
 """
 
+from collections import namedtuple
+
+# everything a link controller reads from a request queue before an attempt, see RequestQueue.snapshot
+QueueSnapshot = namedtuple("QueueSnapshot", ["length", "is_empty", "request", "time"])
+
 
 class RequestQueue:
     """
@@ -203,6 +208,36 @@ class RequestQueue:
 
         return None, None
 
+    def snapshot(self, out_port, policy=OLDEST):
+        """
+        Return the total length of the queue together with the request that :meth:`peek_request` would return for
+        the given port (and any flow id), in a single call.
+
+        Parameters
+        ----------
+        out_port : str
+            The name of the port to peek the request from
+        policy : int
+            The policy to use when peeking the request. It can be either OLDEST (0) or YOUNGEST (1)
+
+        Returns
+        -------
+        QueueSnapshot
+            A named tuple with the total number of requests in the queue (``length``), whether it is empty
+            (``is_empty``), and the peeked request and the time it was added to the queue (``request``, ``time``),
+            both None if there are no requests for that port
+        """
+        length = 0
+        for queue in self._requests.values():
+            length += len(queue)
+
+        request, time = None, None
+        queue = self._requests.get(out_port)
+        if queue:
+            request, time = queue[0] if policy == self.OLDEST else queue[-1]
+
+        return QueueSnapshot(length, length == 0, request, time)
+
     def delete_requests(self, flow_id):
         """
         Delete all requests for a given flow id
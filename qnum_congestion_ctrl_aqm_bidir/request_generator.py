@@ -14,14 +14,30 @@ class RequestGenerator:
         Random number generator
     rng_index : int
         Index of the random number generator to use
+    batch_size : int, optional
+        If positive, the gaps are drawn ``batch_size`` at a time from the numpy generator ``rng_index`` of ``rng``
+        and consumed from a buffer. This draws a different random sequence than the default (0), which draws one gap
+        per request from the Python generator ``rng_index`` and reproduces the results of earlier runs.
 
     """
-    def __init__(self, arrival_rate, rng, rng_index):
+    def __init__(self, arrival_rate, rng, rng_index, batch_size=0):
         self.arrival_rate = arrival_rate  # packets per second
         self.arrival_rate_us = arrival_rate/1e6  # packets per us
         self.rng = rng
         self.rng_index = rng_index
 
+        self.batch_size = batch_size
+        self._buf = None  # buffer of pre-drawn gaps, only used if batch_size > 0
+        self._cursor = batch_size  # position of the next gap in the buffer, the buffer is drawn on the first request
+
+    def _refill(self):
+        """
+        Draw the next batch_size gaps in one call to the numpy generator
+        """
+        self._buf = self.rng.numpy_generators[self.rng_index].exponential(1 / self.arrival_rate_us,
+                                                                          self.batch_size).tolist()
+        self._cursor = 0
+
     def next_request_gap(self):
         """
         Generate the time of the next request
@@ -37,5 +53,12 @@ class RequestGenerator:
             Time of the next request
 
         """
+        if self.batch_size > 0:
+            if self._cursor == self.batch_size:
+                self._refill()
+            rnd = self._buf[self._cursor]
+            self._cursor += 1
+            return rnd
+
         rnd = self.rng.expovariate(self.arrival_rate_us, self.rng_index)
         return rnd
@@ -20,3 +20,18 @@ def sanitize_flow_descriptors(flow_descriptors):
             raise ValueError("flow_id in flow_descriptor does not match the key in the dictionary")
 
     return list(flow_descriptors_dict.values())
+
+
+SANITIZED_FLOW_DESCRIPTORS_KEY = "sanitized_flow_descriptors"
+
+
+def get_flow_descriptors(global_params):
+    """
+    Return the sanitized flow descriptors of a simulation (see sanitize_flow_descriptors). They are sanitized by the
+    first module asking for them and cached in the global parameters of the simulation, which every module shares
+    """
+    flow_descriptors = global_params.get(SANITIZED_FLOW_DESCRIPTORS_KEY)
+    if flow_descriptors is None:
+        flow_descriptors = sanitize_flow_descriptors(global_params["flow_descriptors"])
+        global_params[SANITIZED_FLOW_DESCRIPTORS_KEY] = flow_descriptors
+    return flow_descriptors